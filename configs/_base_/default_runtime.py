@@ -19,12 +19,21 @@ amp_dtype = "float16"
 empty_cache = False
 empty_cache_per_epoch = False
 find_unused_parameters = False
+# torch.compile model in trainer and tester, disable with None
+# example: compile = dict(mode="max-autotune-no-cudagraphs", dynamic=True, criteria=True, cache_dir="exp/compile_cache")
+# compile errors are raised, set suppress_errors=True to fall back to eager instead
+compile = None
 
 enable_wandb = True
 wandb_project = "pointcept"  # custom your project name e.g. Sonata, PTv3
 wandb_key = None  # wandb token, default is None. If None, login with `wandb login` in your terminal
 
 mix_prob = 0
+# batch-level augmentation applied on device after collation, disable with None
+# example: batch_transform = [dict(type="BatchRandomRotate", angle=[-1, 1], axis="z", p=0.5), dict(type="BatchCollect", feat_keys=("coord", "color"))]
+# coord augmentations recompute grid_coord (if present) and then need grid_size, e.g.
+# dict(type="BatchRandomScale", scale=[0.9, 1.1], grid_size=0.02)
+batch_transform = None
 param_dicts = None  # example: param_dicts = [dict(keyword="block", lr_scale=0.1)]
 
 # hook
@@ -42,4 +51,13 @@ hooks = [
 train = dict(type="DefaultTrainer")
 
 # Tester
+# optimize=True folds BatchNorm into Linear and strips dropout / criteria for inference
+# quantize=True applies dynamic int8 quantization to nn.Linear and tests on cpu
+# type="MultiCkptSemSegTester", weights=[...] evaluates several checkpoints (and their
+# ensemble=True) in one pass over the test data
+# reuse_neighbours=True (SemSegTester) shares kNN / pooling / serialization between the
+# augmentation variants of a fragment, set data.test.test_cfg.share_partition=True
+# memory_budget=<GiB> (SemSegTester) profiles the peak memory of the model and sizes
+# SphereCrop(mode="all") test crops (replacing test_cfg.crop) and fragment batches to
+# fill the budget (cuda), profiling runs on at most profile_points=100000 points
 test = dict(type="SemSegTester", verbose=True)
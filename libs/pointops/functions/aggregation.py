@@ -1,7 +1,11 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import aggregation_forward_cuda, aggregation_backward_cuda
+try:
+    from pointops._C import aggregation_forward_cuda, aggregation_backward_cuda
+except ImportError:
+    # cuda extension is not built, aggregation is cuda only
+    aggregation_forward_cuda = aggregation_backward_cuda = None
 
 
 class Aggregation(Function):
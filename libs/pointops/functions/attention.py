@@ -1,12 +1,17 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import (
-    attention_relation_step_forward_cuda,
-    attention_relation_step_backward_cuda,
-    attention_fusion_step_forward_cuda,
-    attention_fusion_step_backward_cuda,
-)
+try:
+    from pointops._C import (
+        attention_relation_step_forward_cuda,
+        attention_relation_step_backward_cuda,
+        attention_fusion_step_forward_cuda,
+        attention_fusion_step_backward_cuda,
+    )
+except ImportError:
+    # cuda extension is not built, attention steps are cuda only
+    attention_relation_step_forward_cuda = attention_relation_step_backward_cuda = None
+    attention_fusion_step_forward_cuda = attention_fusion_step_backward_cuda = None
 
 
 class AttentionRelationStep(Function):
@@ -0,0 +1,166 @@
+"""
+CPU implementations of pointops, used when inputs live on cpu. Outputs follow the
+layout of the cuda kernels (e.g. -1 index and 1e10 squared distance as knn
+placeholders), so that models run unchanged on cpu.
+"""
+
+import numpy as np
+import torch
+from scipy.spatial import cKDTree
+
+
+def segments(offset):
+    end = offset.tolist()
+    start = [0] + end[:-1]
+    return zip(start, end)
+
+
+def knn_query_cpu(nsample, xyz, offset, new_xyz, new_offset, workers=-1):
+    """
+    input: coords: (n, 3), new_xyz: (m, 3), offset: (b), new_offset: (b)
+    output: idx: (m, nsample) -1 is placeholder, dist2: (m, nsample)
+    """
+    m = new_xyz.shape[0]
+    idx = torch.full((m, nsample), -1, dtype=torch.int)
+    dist2 = torch.full((m, nsample), 1e10, dtype=torch.float)
+    xyz = xyz.detach().float().numpy()
+    new_xyz = new_xyz.detach().float().numpy()
+    for (s, e), (new_s, new_e) in zip(segments(offset), segments(new_offset)):
+        k = min(nsample, e - s)
+        if k == 0 or new_e == new_s:
+            continue
+        # kd-tree per sample of the batch, queries run with multiple threads
+        tree = cKDTree(xyz[s:e])
+        dist, index = tree.query(new_xyz[new_s:new_e], k=k, workers=workers)
+        dist = torch.from_numpy(dist).float().view(new_e - new_s, k)
+        index = torch.from_numpy(index).int().view(new_e - new_s, k)
+        idx[new_s:new_e, :k] = index + s
+        dist2[new_s:new_e, :k] = dist**2
+    return idx, dist2
+
+
+def ball_query_cpu(
+    nsample,
+    max_radius,
+    min_radius,
+    xyz,
+    offset,
+    new_xyz,
+    new_offset,
+    order=None,
+    workers=-1,
+):
+    """
+    input: coords: (n, 3), new_xyz: (m, 3), offset: (b), new_offset: (b)
+        order: (n) optional random order of points within each sample, then the
+        first nsample candidates in this order are kept (random ball query)
+    output: idx: (m, nsample) -1 is placeholder, dist2: (m, nsample)
+    """
+    m = new_xyz.shape[0]
+    idx = torch.full((m, nsample), -1, dtype=torch.int)
+    dist2 = torch.full((m, nsample), 1e10, dtype=torch.float)
+    xyz = xyz.detach().float().numpy()
+    new_xyz = new_xyz.detach().float().numpy()
+    slot = np.arange(nsample)
+    if order is not None:
+        rank = np.empty(xyz.shape[0], dtype=np.int64)
+        rank[order.long().numpy()] = np.arange(xyz.shape[0])
+    for (s, e), (new_s, new_e) in zip(segments(offset), segments(new_offset)):
+        if e == s or new_e == new_s:
+            continue
+        tree = cKDTree(xyz[s:e])
+        neighbours = tree.query_ball_point(
+            new_xyz[new_s:new_e], max_radius, workers=workers
+        )
+        count = np.fromiter(map(len, neighbours), dtype=np.int64)
+        query = np.repeat(np.arange(new_e - new_s), count)
+        index = np.concatenate(neighbours).astype(np.int64) + s
+        d2 = np.sum((xyz[index] - new_xyz[new_s:new_e][query]) ** 2, axis=1)
+        # same candidates as the cuda kernel, (near) duplicates and the shell
+        valid = (d2 <= 1e-5) | ((d2 >= min_radius**2) & (d2 < max_radius**2))
+        query, index, d2 = query[valid], index[valid], d2[valid]
+        sort = np.lexsort((d2 if order is None else rank[index], query))
+        query, index, d2 = query[sort], index[sort], d2[sort]
+        count = np.bincount(query, minlength=new_e - new_s)
+        start = np.cumsum(count) - count
+        if order is None:
+            # keep all candidates sorted by distance, or nsample evenly spaced ones
+            pos = np.where(
+                count[:, None] <= nsample,
+                slot[None, :],
+                (count[:, None] / nsample * slot[None, :]).astype(np.int64),
+            )
+        else:
+            pos = np.broadcast_to(slot[None, :], (new_e - new_s, nsample))
+        mask = slot[None, :] < count[:, None]
+        select = (start[:, None] + pos)[mask]
+        rows, cols = np.nonzero(mask)
+        idx[new_s + rows, cols] = torch.from_numpy(index[select]).int()
+        dist2[new_s + rows, cols] = torch.from_numpy(d2[select]).float()
+    return idx, dist2
+
+
+def farthest_point_sampling_cpu(xyz, offset, new_offset):
+    """
+    input: coords: (n, 3), offset: (b), new_offset: (b)
+    output: idx: (m)
+    """
+    idx = []
+    xyz = xyz.detach().float().numpy()
+    for (s, e), (new_s, new_e) in zip(segments(offset), segments(new_offset)):
+        # per axis contiguous coords and preallocated buffers, each step updates
+        # the min distance of the whole segment with a few in-place ufuncs
+        x, y, z = (np.ascontiguousarray(xyz[s:e, i]) for i in range(3))
+        tmp = np.full(e - s, 1e10, dtype=np.float32)
+        dist = np.empty(e - s, dtype=np.float32)
+        buffer = np.empty(e - s, dtype=np.float32)
+        sample = np.zeros(new_e - new_s, dtype=np.int64)
+        old = 0
+        for j in range(1, new_e - new_s):
+            np.square(np.subtract(x, x[old], out=dist), out=dist)
+            dist += np.square(np.subtract(y, y[old], out=buffer), out=buffer)
+            dist += np.square(np.subtract(z, z[old], out=buffer), out=buffer)
+            np.minimum(tmp, dist, out=tmp)
+            old = tmp.argmax()
+            sample[j] = old
+        idx.append(torch.from_numpy(sample + s))
+    return torch.cat(idx).int()
+
+
+def grouping_forward_cpu(input, idx):
+    """
+    input: input: (n, c), idx : (m, nsample)
+    output: (m, nsample, c)
+    """
+    return input[idx.long()]
+
+
+def grouping_backward_cpu(grad_output, idx, n):
+    """
+    input: grad_out: (m, nsample, c), idx : (m, nsample)
+    output: (n, c)
+    """
+    c = grad_output.shape[-1]
+    grad_input = torch.zeros((n, c), dtype=grad_output.dtype)
+    grad_input.index_add_(0, idx.view(-1).long(), grad_output.reshape(-1, c))
+    return grad_input
+
+
+def interpolation_forward_cpu(input, idx, weight):
+    """
+    input: input: (m, c), idx: (n, k), weight: (n, k)
+    output: (n, c)
+    """
+    return torch.einsum("nkc,nk->nc", input[idx.long()], weight)
+
+
+def interpolation_backward_cpu(grad_output, idx, weight, m):
+    """
+    input: grad_output: (n, c), idx: (n, k), weight: (n, k)
+    output: (m, c)
+    """
+    c = grad_output.shape[-1]
+    grad_input = torch.zeros((m, c), dtype=grad_output.dtype)
+    grad = grad_output.unsqueeze(1) * weight.unsqueeze(-1)  # (n, k, c)
+    grad_input.index_add_(0, idx.view(-1).long(), grad.reshape(-1, c))
+    return grad_input
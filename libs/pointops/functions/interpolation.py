@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import interpolation_forward_cuda, interpolation_backward_cuda
+try:
+    from pointops._C import interpolation_forward_cuda, interpolation_backward_cuda
+except ImportError:
+    # cuda extension is not built, only cpu implementation is available
+    interpolation_forward_cuda = interpolation_backward_cuda = None
+from .cpu import interpolation_forward_cpu, interpolation_backward_cpu
 from .query import knn_query
 
 
@@ -38,8 +43,11 @@ class Interpolation(Function):
         weight = dist_recip / norm  # (n, k)
 
         n, c, m = new_xyz.shape[0], input.shape[1], input.shape[0]
-        output = torch.zeros((n, c), dtype=torch.float, device=xyz.device)
-        interpolation_forward_cuda(n, c, k, input, idx, weight, output)
+        if not input.is_cuda:
+            output = interpolation_forward_cpu(input, idx, weight)
+        else:
+            output = torch.zeros((n, c), dtype=torch.float, device=xyz.device)
+            interpolation_forward_cuda(n, c, k, input, idx, weight, output)
         ctx.m, ctx.k = m, k
         ctx.save_for_backward(idx, weight)
         return output
@@ -53,6 +61,9 @@ class Interpolation(Function):
         m, k = ctx.m, ctx.k
         idx, weight = ctx.saved_tensors
         n, c = grad_output.shape
+        if not grad_output.is_cuda:
+            grad_input = interpolation_backward_cpu(grad_output, idx, weight, m)
+            return None, None, grad_input, None, None, None
         grad_input = torch.zeros((m, c), dtype=torch.float, device=idx.device)
         interpolation_backward_cuda(n, c, k, grad_output, idx, weight, grad_input)
         return None, None, grad_input, None, None, None
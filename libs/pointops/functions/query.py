@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import knn_query_cuda, random_ball_query_cuda, ball_query_cuda
+try:
+    from pointops._C import knn_query_cuda, random_ball_query_cuda, ball_query_cuda
+except ImportError:
+    # cuda extension is not built, only cpu implementation is available
+    knn_query_cuda = random_ball_query_cuda = ball_query_cuda = None
+from .cpu import knn_query_cpu, ball_query_cpu
 
 
 class KNNQuery(Function):
@@ -15,6 +20,9 @@ class KNNQuery(Function):
             new_xyz = xyz
             new_offset = offset
         assert xyz.is_contiguous() and new_xyz.is_contiguous()
+        if not xyz.is_cuda:
+            idx, dist2 = knn_query_cpu(nsample, xyz, offset, new_xyz, new_offset)
+            return idx, torch.sqrt(dist2)
         m = new_xyz.shape[0]
         idx = torch.zeros((m, nsample), dtype=torch.int, device=xyz.device)
         dist2 = torch.zeros((m, nsample), dtype=torch.float, device=xyz.device)
@@ -52,6 +60,18 @@ class RandomBallQuery(Function):
                 torch.randperm(e_k - s_k, dtype=torch.int32, device=offset.device) + s_k
             )
         order = torch.cat(order, dim=0)
+        if not xyz.is_cuda:
+            idx, dist2 = ball_query_cpu(
+                nsample,
+                max_radius,
+                min_radius,
+                xyz,
+                offset,
+                new_xyz,
+                new_offset,
+                order=order,
+            )
+            return idx, torch.sqrt(dist2)
         idx = torch.zeros((m, nsample), dtype=torch.int, device=xyz.device)
         dist2 = torch.zeros((m, nsample), dtype=torch.float, device=xyz.device)
         random_ball_query_cuda(
@@ -89,6 +109,11 @@ class BallQuery(Function):
             new_offset = offset
         assert xyz.is_contiguous() and new_xyz.is_contiguous()
         assert min_radius < max_radius
+        if not xyz.is_cuda:
+            idx, dist2 = ball_query_cpu(
+                nsample, max_radius, min_radius, xyz, offset, new_xyz, new_offset
+            )
+            return idx, torch.sqrt(dist2)
 
         m = new_xyz.shape[0]
         idx = torch.zeros((m, nsample), dtype=torch.int, device=xyz.device)
@@ -1,7 +1,11 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import subtraction_forward_cuda, subtraction_backward_cuda
+try:
+    from pointops._C import subtraction_forward_cuda, subtraction_backward_cuda
+except ImportError:
+    # cuda extension is not built, subtraction is cuda only
+    subtraction_forward_cuda = subtraction_backward_cuda = None
 
 
 class Subtraction(Function):
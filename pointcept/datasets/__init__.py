@@ -1,6 +1,7 @@
 from .defaults import DefaultDataset, ConcatDataset
 from .builder import build_dataset
 from .utils import point_collate_fn, collate_fn
+from .batch_transform import BatchCompose
 
 # indoor scene
 from .s3dis import S3DISDataset
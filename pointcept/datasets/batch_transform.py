@@ -0,0 +1,292 @@
+"""
+Batch-level point cloud augmentation
+
+Vectorized counterparts of the per-sample augmentations in transform.py. They run
+on the collated batch (after `point_collate_fn`) on whatever device the batch lives
+on, and use `offset` to draw independent random parameters for every sample.
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import math
+import torch
+from collections.abc import Sequence
+
+from pointcept.utils.registry import Registry
+
+BATCH_TRANSFORMS = Registry("batch_transforms")
+
+
+@torch.no_grad()
+def offset2batch(offset):
+    bincount = torch.diff(
+        offset, prepend=torch.tensor([0], device=offset.device, dtype=offset.dtype)
+    )
+    return torch.arange(
+        len(bincount), device=offset.device, dtype=torch.long
+    ).repeat_interleave(bincount)
+
+
+def segment_min_max(feat, batch, num_samples):
+    # per sample min / max of (n, c) feat, return (b, c) tensors
+    index = batch.unsqueeze(-1).expand(-1, feat.shape[1])
+    lo = feat.new_zeros(num_samples, feat.shape[1]).scatter_reduce(
+        0, index, feat, reduce="amin", include_self=False
+    )
+    hi = feat.new_zeros(num_samples, feat.shape[1]).scatter_reduce(
+        0, index, feat, reduce="amax", include_self=False
+    )
+    return lo, hi
+
+
+def random_apply(num_samples, p, device):
+    # (b,) bool mask, True for samples the augmentation is applied to
+    return torch.rand(num_samples, device=device) < p
+
+
+def update_grid_coord(data_dict, grid_size=None):
+    # grid_coord produced by GridSample goes stale once coord is augmented,
+    # recompute it from the augmented coord the same way GridSample does
+    if "grid_coord" not in data_dict.keys():
+        return data_dict
+    assert grid_size is not None, (
+        "Batch coord augmentation after GridSample(return_grid_coord=True) "
+        "requires grid_size to recompute grid_coord."
+    )
+    coord = data_dict["coord"]
+    batch = offset2batch(data_dict["offset"])
+    grid_size = torch.tensor(grid_size, device=coord.device, dtype=coord.dtype)
+    grid_coord = torch.floor(coord / grid_size).int()
+    min_coord, _ = segment_min_max(grid_coord, batch, len(data_dict["offset"]))
+    data_dict["grid_coord"] = grid_coord - min_coord[batch]
+    return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchRandomRotate(object):
+    def __init__(
+        self,
+        angle=None,
+        center=None,
+        axis="z",
+        always_apply=False,
+        p=0.5,
+        grid_size=None,
+    ):
+        self.angle = [-1, 1] if angle is None else angle
+        assert axis in ["x", "y", "z"]
+        self.axis = axis
+        self.always_apply = always_apply
+        self.p = p if not self.always_apply else 1
+        self.center = center
+        self.grid_size = grid_size
+
+    def rotation_matrix(self, angle):
+        # angle: (b,) -> rotation matrix: (b, 3, 3)
+        rot_cos, rot_sin = torch.cos(angle), torch.sin(angle)
+        one, zero = torch.ones_like(angle), torch.zeros_like(angle)
+        if self.axis == "x":
+            rot_t = [one, zero, zero, zero, rot_cos, -rot_sin, zero, rot_sin, rot_cos]
+        elif self.axis == "y":
+            rot_t = [rot_cos, zero, rot_sin, zero, one, zero, -rot_sin, zero, rot_cos]
+        else:
+            rot_t = [rot_cos, -rot_sin, zero, rot_sin, rot_cos, zero, zero, zero, one]
+        return torch.stack(rot_t, dim=-1).reshape(-1, 3, 3)
+
+    def __call__(self, data_dict):
+        if "coord" not in data_dict.keys():
+            return data_dict
+        coord = data_dict["coord"]
+        batch = offset2batch(data_dict["offset"])
+        num_samples = len(data_dict["offset"])
+        angle = torch.empty(num_samples, device=coord.device).uniform_(
+            self.angle[0], self.angle[1]
+        )
+        angle = angle * math.pi * random_apply(num_samples, self.p, coord.device)
+        rot_t = self.rotation_matrix(angle).to(coord.dtype)[batch]  # (n, 3, 3)
+        if self.center is None:
+            lo, hi = segment_min_max(coord, batch, num_samples)
+            center = ((lo + hi) / 2)[batch]
+        else:
+            center = torch.tensor(self.center, device=coord.device, dtype=coord.dtype)
+        coord = torch.einsum("nij,nj->ni", rot_t, coord - center) + center
+        data_dict["coord"] = coord
+        if "normal" in data_dict.keys():
+            data_dict["normal"] = torch.einsum("nij,nj->ni", rot_t, data_dict["normal"])
+        return update_grid_coord(data_dict, self.grid_size)
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchRandomScale(object):
+    def __init__(self, scale=None, anisotropic=False, grid_size=None):
+        self.scale = scale if scale is not None else [0.95, 1.05]
+        self.anisotropic = anisotropic
+        self.grid_size = grid_size
+
+    def __call__(self, data_dict):
+        if "coord" in data_dict.keys():
+            coord = data_dict["coord"]
+            batch = offset2batch(data_dict["offset"])
+            scale = torch.empty(
+                len(data_dict["offset"]),
+                3 if self.anisotropic else 1,
+                device=coord.device,
+                dtype=coord.dtype,
+            ).uniform_(self.scale[0], self.scale[1])
+            data_dict["coord"] = coord * scale[batch]
+            data_dict = update_grid_coord(data_dict, self.grid_size)
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchRandomFlip(object):
+    def __init__(self, p=0.5, grid_size=None):
+        self.p = p
+        self.grid_size = grid_size
+
+    def __call__(self, data_dict):
+        batch = offset2batch(data_dict["offset"])
+        num_samples = len(data_dict["offset"])
+        device = data_dict["offset"].device
+        # flip x and y independently, keep z
+        sign = torch.ones(num_samples, 3, device=device)
+        sign[:, 0] -= 2 * random_apply(num_samples, self.p, device)
+        sign[:, 1] -= 2 * random_apply(num_samples, self.p, device)
+        sign = sign[batch]
+        if "coord" in data_dict.keys():
+            data_dict["coord"] = data_dict["coord"] * sign.to(data_dict["coord"].dtype)
+            data_dict = update_grid_coord(data_dict, self.grid_size)
+        if "normal" in data_dict.keys():
+            data_dict["normal"] = data_dict["normal"] * sign.to(
+                data_dict["normal"].dtype
+            )
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchRandomJitter(object):
+    def __init__(self, sigma=0.01, clip=0.05, grid_size=None):
+        assert clip > 0
+        self.sigma = sigma
+        self.clip = clip
+        self.grid_size = grid_size
+
+    def __call__(self, data_dict):
+        if "coord" in data_dict.keys():
+            jitter = torch.clamp(
+                self.sigma * torch.randn_like(data_dict["coord"]),
+                -self.clip,
+                self.clip,
+            )
+            data_dict["coord"] = data_dict["coord"] + jitter
+            data_dict = update_grid_coord(data_dict, self.grid_size)
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchChromaticAutoContrast(object):
+    def __init__(self, p=0.2, blend_factor=None):
+        self.p = p
+        self.blend_factor = blend_factor
+
+    def __call__(self, data_dict):
+        if "color" not in data_dict.keys():
+            return data_dict
+        color = data_dict["color"]
+        batch = offset2batch(data_dict["offset"])
+        num_samples = len(data_dict["offset"])
+        lo, hi = segment_min_max(color[:, :3], batch, num_samples)
+        scale = 255 / (hi - lo)
+        contrast_feat = (color[:, :3] - lo[batch]) * scale[batch]
+        if self.blend_factor is None:
+            blend_factor = torch.rand(num_samples, 1, device=color.device)
+        else:
+            blend_factor = torch.full((num_samples, 1), self.blend_factor)
+            blend_factor = blend_factor.to(color.device)
+        blend_factor = (
+            blend_factor * random_apply(num_samples, self.p, color.device)[:, None]
+        )
+        blend_factor = blend_factor.to(color.dtype)[batch]
+        color = color.clone()
+        color[:, :3] = (1 - blend_factor) * color[:, :3] + blend_factor * contrast_feat
+        data_dict["color"] = color
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchChromaticTranslation(object):
+    def __init__(self, p=0.95, ratio=0.05):
+        self.p = p
+        self.ratio = ratio
+
+    def __call__(self, data_dict):
+        if "color" in data_dict.keys():
+            color = data_dict["color"]
+            batch = offset2batch(data_dict["offset"])
+            num_samples = len(data_dict["offset"])
+            tr = (torch.rand(num_samples, 3, device=color.device) - 0.5) * (
+                255 * 2 * self.ratio
+            )
+            tr = tr * random_apply(num_samples, self.p, color.device)[:, None]
+            color = color.clone()
+            color[:, :3] = torch.clamp(tr.to(color.dtype)[batch] + color[:, :3], 0, 255)
+            data_dict["color"] = color
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchChromaticJitter(object):
+    def __init__(self, p=0.95, std=0.005):
+        self.p = p
+        self.std = std
+
+    def __call__(self, data_dict):
+        if "color" in data_dict.keys():
+            color = data_dict["color"]
+            batch = offset2batch(data_dict["offset"])
+            num_samples = len(data_dict["offset"])
+            noise = torch.randn_like(color[:, :3]) * (self.std * 255)
+            noise = noise * random_apply(num_samples, self.p, color.device)[batch, None]
+            color = color.clone()
+            color[:, :3] = torch.clamp(noise + color[:, :3], 0, 255)
+            data_dict["color"] = color
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchNormalizeColor(object):
+    def __call__(self, data_dict):
+        if "color" in data_dict.keys():
+            data_dict["color"] = data_dict["color"] / 127.5 - 1
+        return data_dict
+
+
+@BATCH_TRANSFORMS.register_module()
+class BatchCollect(object):
+    def __init__(self, **kwargs):
+        """
+        Rebuild concatenated features after augmentation,
+        e.g. BatchCollect(feat_keys=[coord, color])
+        """
+        self.kwargs = kwargs
+
+    def __call__(self, data_dict):
+        for name, keys in self.kwargs.items():
+            name = name.replace("_keys", "")
+            assert isinstance(keys, Sequence)
+            data_dict[name] = torch.cat([data_dict[key].float() for key in keys], dim=1)
+        return data_dict
+
+
+class BatchCompose(object):
+    def __init__(self, cfg=None):
+        self.cfg = cfg if cfg is not None else []
+        self.transforms = []
+        for t_cfg in self.cfg:
+            self.transforms.append(BATCH_TRANSFORMS.build(t_cfg))
+
+    def __call__(self, data_dict):
+        for t in self.transforms:
+            data_dict = t(data_dict)
+        return data_dict
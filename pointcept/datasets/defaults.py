@@ -8,6 +8,8 @@ Please cite our work if the code is helpful to you.
 import os
 import glob
 import json
+import hashlib
+import shutil
 from re import split
 
 import numpy as np
@@ -19,7 +21,8 @@ from pointcept.utils.logger import get_root_logger
 from pointcept.utils.cache import shared_dict
 
 from .builder import DATASETS, build_dataset
-from .transform import Compose, TRANSFORMS
+from .utils import save_fragment_cache, load_fragment_cache
+from .transform import Compose, TRANSFORMS, index_operator
 
 
 @DATASETS.register_module()
@@ -44,11 +47,14 @@ class DefaultDataset(Dataset):
         cache=False,
         ignore_index=-1,
         loop=1,
+        transform_cache=None,
+        fragment_cache=None,
     ):
         super(DefaultDataset, self).__init__()
         self.data_root = data_root
         self.split = split
-        self.transform = Compose(transform)
+        # folder caching output of the deterministic prefix of transform
+        self.transform = Compose(transform, cache_dir=transform_cache)
         self.cache = cache
         self.ignore_index = ignore_index
         self.loop = (
@@ -56,6 +62,8 @@ class DefaultDataset(Dataset):
         )  # force make loop = 1 while in test mode
         self.test_mode = test_mode
         self.test_cfg = test_cfg if test_mode else None
+        # folder caching fragment_list of test data, see prepare_test_data
+        self.fragment_cache = fragment_cache if test_mode else None
 
         if test_mode:
             self.test_voxelize = TRANSFORMS.build(self.test_cfg.voxelize)
@@ -143,18 +151,76 @@ class DefaultDataset(Dataset):
             os.path.dirname(self.data_list[idx % len(self.data_list)])
         )
 
+    def get_data_files(self, idx):
+        # files read by get_data for the sample
+        data_path = self.data_list[idx % len(self.data_list)]
+        if not isinstance(data_path, str):
+            return []
+        if os.path.isdir(data_path):
+            return sorted(
+                os.path.join(data_path, asset)
+                for asset in os.listdir(data_path)
+                if asset.endswith(".npy") and asset[:-4] in self.VALID_ASSETS
+            )
+        return [data_path]
+
+    def get_data_config(self):
+        # dataset options the output of get_data depends on
+        return dict(ignore_index=self.ignore_index, valid_assets=self.VALID_ASSETS)
+
+    def get_data_file_stats(self, idx):
+        stats = []
+        for path in self.get_data_files(idx):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stats.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+        return stats
+
+    def get_data_identity(self, idx):
+        # identify the source of a sample, key of transform and fragment cache:
+        # stats of the files get_data reads and the dataset options it depends on
+        identity = [
+            self.__class__.__name__,
+            self.get_data_name(idx),
+            self.get_data_config(),
+        ] + self.get_data_file_stats(idx)
+        return json.dumps(identity, sort_keys=True, default=str)
+
     def prepare_train_data(self, idx):
         # load data
-        data_dict = self.get_data(idx)
-        data_dict = self.transform(data_dict)
+        data_dict = self.transform.cached_call(
+            self.get_data_identity(idx), lambda: self.get_data(idx)
+        )
         return data_dict
 
+    def get_fragment_cache_path(self, idx):
+        # key by the config of the whole test pipeline, the sample, and its identity
+        # as "<dataset options>_<loaded file stats>" (see get_data_identity)
+        pipeline = json.dumps(
+            [self.transform.cfg, self.test_cfg], sort_keys=True, default=str
+        )
+        sample = f"{self.__class__.__name__}:{self.get_data_name(idx)}"
+        config = json.dumps(self.get_data_config(), sort_keys=True, default=str)
+        files = json.dumps(self.get_data_file_stats(idx), default=str)
+        return os.path.join(
+            self.fragment_cache,
+            hashlib.md5(pipeline.encode()).hexdigest(),
+            hashlib.md5(sample.encode()).hexdigest(),
+            f"{hashlib.md5(config.encode()).hexdigest()}_"
+            f"{hashlib.md5(files.encode()).hexdigest()}",
+        )
+
     def prepare_test_data(self, idx):
+        if self.fragment_cache is not None:
+            cache_path = self.get_fragment_cache_path(idx)
+            if os.path.isdir(cache_path):
+                return load_fragment_cache(cache_path)
         import random
         counter = random.randint(1,1000)
         # load data
-        data_dict = self.get_data(idx)
-        data_dict = self.transform(data_dict)
+        data_dict = self.transform.cached_call(
+            self.get_data_identity(idx), lambda: self.get_data(idx)
+        )
         print("PREPARE TEST DATA START "+str(counter)+"############################################")
 
         print("data_dict "+str(counter)+":"+str(data_dict))
@@ -178,24 +244,87 @@ class DefaultDataset(Dataset):
             data_dict_list.append(aug(deepcopy(data_dict)))
 
         fragment_list = []
+        # points left out by GridSample max_parts / coverage, one group per variant
+        # with the range of fragments the variant contributes, see FragmentFill
+        fill_index, fill_source, fill_fragment = [], [], []
         for data in data_dict_list:
+            fill = None
             if self.test_voxelize is not None:
                 data_part_list = self.test_voxelize(data)
+                if "fill_index" in data_part_list[0]:
+                    fill = (
+                        data_part_list[0].pop("fill_index"),
+                        data_part_list[0].pop("fill_source"),
+                    )
             else:
                 data["index"] = np.arange(data["coord"].shape[0])
                 data_part_list = [data]
+            start = len(fragment_list)
             for data_part in data_part_list:
                 if self.test_crop is not None:
                     data_part = self.test_crop(data_part)
                 else:
                     data_part = [data_part]
                 fragment_list += data_part
+            if fill is not None:
+                fill_index.append(fill[0])
+                fill_source.append(fill[1])
+                fill_fragment.append([start, len(fragment_list)])
+            if self.test_cfg.get("share_partition", False):
+                # the first variant decides the partition of all variants
+                break
+        if self.test_cfg.get("share_partition", False):
+            # variants of the same fragment are placed next to each other, so that
+            # the tester can reuse neighbourhoods across them (see NeighbourCache)
+            fragment_list = [
+                self.share_partition(data, fragment) if i > 0 else fragment
+                for fragment in fragment_list
+                for i, data in enumerate(data_dict_list)
+            ]
+            # all variants leave out the same points, filled once from their sum
+            fill_fragment = [[0, len(fragment_list)] for _ in fill_fragment]
+
+        if len(fill_index) > 0:
+            result_dict["fill_index"] = np.concatenate(fill_index)
+            result_dict["fill_source"] = np.concatenate(fill_source)
+            result_dict["fill_offset"] = np.cumsum([len(i) for i in fill_index])
+            result_dict["fill_fragment"] = np.array(fill_fragment)
 
         for i in range(len(fragment_list)):
             fragment_list[i] = self.post_transform(fragment_list[i])
         result_dict["fragment_list"] = fragment_list
+        if self.fragment_cache is not None:
+            # drop stale caches of the sample built with the same dataset options
+            # from older versions of its files, leave in-flight (*.tmp) writes alone
+            sample_dir, name = os.path.split(cache_path)
+            config = name.split("_")[0]
+            if os.path.isdir(sample_dir):
+                for stale in os.listdir(sample_dir):
+                    if (
+                        stale != name
+                        and stale.split("_")[0] == config
+                        and not stale.endswith(".tmp")
+                    ):
+                        shutil.rmtree(
+                            os.path.join(sample_dir, stale), ignore_errors=True
+                        )
+            os.makedirs(sample_dir, exist_ok=True)
+            save_fragment_cache(cache_path, result_dict)
         return result_dict
 
+    def share_partition(self, data_dict, fragment):
+        # take the points of a fragment (of another variant) from data_dict
+        data_part = index_operator(data_dict, fragment["index"], duplicate=True)
+        data_part["index"] = fragment["index"]
+        if "grid_coord" in fragment:
+            grid_size = np.array(self.test_voxelize.grid_size)
+            grid_coord = np.floor(data_dict["coord"] / grid_size).astype(int)
+            grid_coord -= grid_coord.min(0)
+            data_part["grid_coord"] = grid_coord[fragment["index"]]
+            if "grid_coord" not in data_part["index_valid_keys"]:
+                data_part["index_valid_keys"].append("grid_coord")
+        return data_part
+
     def __getitem__(self, idx):
         if self.test_mode:
             return self.prepare_test_data(idx)
@@ -10,7 +10,6 @@ Please cite our work if the code is helpful to you.
 
 import os
 import numpy as np
-import copy
 import pointops
 import torch
 from torch.utils.data import Dataset
@@ -20,6 +19,7 @@ from copy import deepcopy
 from pointcept.utils.logger import get_root_logger
 from .builder import DATASETS
 from .transform import Compose
+from .utils import packed_store
 
 
 @DATASETS.register_module()
@@ -67,25 +67,40 @@ class ModelNetDataset(Dataset):
             record_name += f"_{num_points}points"
             if uniform_sampling:
                 record_name += "_uniform"
+        self.data = {}
+        if save_record:
+            # packed memory-mapped record, shared read-only by workers and ranks
+            logger.info(f"Loading record: {record_name} ...")
+            sample_list = packed_store(
+                os.path.join(self.data_root, record_name),
+                lambda: self.prepare_record(record_name),
+                sample_names=self.data_list,
+            )
+        else:
+            sample_list = self.prepare_record(record_name)
+        self.data = dict(zip(self.data_list, sample_list))
+
+    def prepare_record(self, record_name):
+        logger = get_root_logger()
         record_path = os.path.join(self.data_root, f"{record_name}.pth")
         if os.path.isfile(record_path):
-            logger.info(f"Loading record: {record_name} ...")
-            self.data = torch.load(record_path, weights_only=False)
+            # convert record saved by previous version
+            data = torch.load(record_path, weights_only=False)
         else:
             logger.info(f"Preparing record: {record_name} ...")
-            self.data = {}
+            data = {}
             for idx in range(len(self.data_list)):
                 data_name = self.data_list[idx]
                 logger.info(f"Parsing data [{idx}/{len(self.data_list)}]: {data_name}")
-                self.data[data_name] = self.get_data(idx)
-            if save_record:
-                torch.save(self.data, record_path)
+                data[data_name] = self.get_data(idx)
+        return [data[data_name] for data_name in self.data_list]
 
     def get_data(self, idx):
         data_idx = idx % len(self.data_list)
         data_name = self.data_list[data_idx]
         if data_name in self.data.keys():
-            return copy.deepcopy(self.data[data_name])
+            # copy the sample out of the (read-only) record
+            return {key: np.array(value) for key, value in self.data[data_name].items()}
         else:
             data_shape = "_".join(data_name.split("_")[0:-1])
             data_path = os.path.join(
@@ -53,6 +53,16 @@ class NuScenesDataset(DefaultDataset):
                 data_list.extend(info)
         return data_list
 
+    def get_data_files(self, idx):
+        data = self.data_list[idx % len(self.data_list)]
+        files = [os.path.join(self.data_root, "raw", data["lidar_path"])]
+        if "gt_segment_path" in data.keys():
+            files.append(os.path.join(self.data_root, "raw", data["gt_segment_path"]))
+        return files
+
+    def get_data_config(self):
+        return dict(ignore_index=self.ignore_index, learning_map=self.learning_map)
+
     def get_data(self, idx):
         data = self.data_list[idx % len(self.data_list)]
         lidar_path = os.path.join(self.data_root, "raw", data["lidar_path"])
@@ -63,6 +63,14 @@ class SemanticKITTIDataset(DefaultDataset):
         )
 
 
+    def get_data_files(self, idx):
+        data_path = self.data_list[idx % len(self.data_list)]
+        label_file = data_path.replace("velodyne", "labels").replace(".bin", ".label")
+        return [data_path, label_file]
+
+    def get_data_config(self):
+        return dict(ignore_index=self.ignore_index, learning_map=self.learning_map)
+
     def get_data(self, idx):
         print(idx)
         data_path = self.data_list[idx % len(self.data_list)]
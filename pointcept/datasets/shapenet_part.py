@@ -18,6 +18,7 @@ from torch.utils.data import Dataset
 from pointcept.utils.logger import get_root_logger
 from .builder import DATASETS
 from .transform import Compose
+from .utils import packed_store
 
 
 @DATASETS.register_module()
@@ -30,6 +31,7 @@ class ShapeNetPartDataset(Dataset):
         test_mode=False,
         test_cfg=None,
         loop=1,
+        save_record=False,
     ):
         super(ShapeNetPartDataset, self).__init__()
         self.data_root = data_root
@@ -40,6 +42,7 @@ class ShapeNetPartDataset(Dataset):
         )  # force make loop = 1 while in test mode
         self.test_mode = test_mode
         self.test_cfg = test_cfg if test_mode else None
+        self.save_record = save_record
         self.cache = {}
 
         # load categories file
@@ -75,18 +78,32 @@ class ShapeNetPartDataset(Dataset):
 
         # load data list
         if isinstance(self.split, str):
-            self.data_list = self.load_data_list(self.split)
+            splits = [self.split]
         elif isinstance(self.split, list):
-            self.data_list = []
-            for s in self.split:
-                self.data_list += self.load_data_list(s)
+            splits = self.split
         else:
             raise NotImplementedError
+        self.data_list = []
+        self.data = []
+        for s in splits:
+            data_list = self.load_data_list(s)
+            self.data_list += data_list
+            if save_record:
+                # packed memory-mapped samples written to data_root, shared read-only
+                # by workers and ranks
+                self.data += packed_store(
+                    os.path.join(self.data_root, f"record_{s}"),
+                    lambda: [self.load_data(data_path) for data_path in data_list],
+                    sample_names=[
+                        os.path.relpath(data_path, self.data_root)
+                        for data_path in data_list
+                    ],
+                )
 
         logger = get_root_logger()
         logger.info(
             "Totally {} x {} samples in {} set.".format(
-                len(self.data_idx), self.loop, split
+                len(self.data_list), self.loop, split
             )
         )
 
@@ -106,37 +123,36 @@ class ShapeNetPartDataset(Dataset):
             ]
         return data_list
 
-    def prepare_train_data(self, idx):
-        # load data
+    def load_data(self, data_path):
+        data = np.loadtxt(data_path).astype(np.float32)
+        cls_token = self.token2category[os.path.basename(os.path.dirname(data_path))]
+        coord, norm, segment = data[:, :3], data[:, 3:6], data[:, 6].astype(np.int32)
+        return dict(coord=coord, norm=norm, segment=segment, cls_token=cls_token)
+
+    def get_data(self, idx):
         data_idx = idx % len(self.data_list)
-        if data_idx in self.cache:
-            coord, norm, segment, cls_token = self.cache[data_idx]
+        if self.save_record:
+            data_dict = self.data[data_idx]
         else:
-            data = np.loadtxt(self.data_list[data_idx]).astype(np.float32)
-            cls_token = self.token2category[
-                os.path.basename(os.path.dirname(self.data_list[data_idx]))
-            ]
-            coord, norm, segment = (
-                data[:, :3],
-                data[:, 3:6],
-                data[:, 6].astype(np.int32),
-            )
-            self.cache[data_idx] = (coord, norm, segment, cls_token)
+            if data_idx not in self.cache:
+                self.cache[data_idx] = self.load_data(self.data_list[data_idx])
+            data_dict = self.cache[data_idx]
+        # copy the sample out of the (read-only) packed record / cache
+        return {
+            key: np.array(value) if isinstance(value, np.ndarray) else value
+            for key, value in data_dict.items()
+        }
 
-        data_dict = dict(coord=coord, norm=norm, segment=segment, cls_token=cls_token)
+    def prepare_train_data(self, idx):
+        # load data
+        data_dict = self.get_data(idx)
         data_dict = self.transform(data_dict)
         return data_dict
 
     def prepare_test_data(self, idx):
         # load data
-        data_idx = self.data_idx[idx % len(self.data_idx)]
-        data = np.loadtxt(self.data_list[data_idx]).astype(np.float32)
-        cls_token = self.token2category[
-            os.path.basename(os.path.dirname(self.data_list[data_idx]))
-        ]
-        coord, norm, segment = data[:, :3], data[:, 3:6], data[:, 6].astype(np.int32)
-
-        data_dict = dict(coord=coord, norm=norm, cls_token=cls_token)
+        data_dict = self.get_data(idx)
+        segment = data_dict.pop("segment")
         data_dict = self.transform(data_dict)
         data_dict_list = []
         for aug in self.aug_transform:
@@ -147,7 +163,7 @@ class ShapeNetPartDataset(Dataset):
         return data_dict
 
     def get_data_name(self, idx):
-        data_idx = self.data_idx[idx % len(self.data_idx)]
+        data_idx = idx % len(self.data_list)
         return os.path.basename(self.data_list[data_idx]).split(".")[0]
 
     def __getitem__(self, idx):
@@ -157,4 +173,4 @@ class ShapeNetPartDataset(Dataset):
             return self.prepare_train_data(idx)
 
     def __len__(self):
-        return len(self.data_idx) * self.loop
+        return len(self.data_list) * self.loop
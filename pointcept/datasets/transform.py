@@ -5,6 +5,10 @@ Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
 Please cite our work if the code is helpful to you.
 """
 
+import os
+import json
+import pickle
+import hashlib
 import random
 import numbers
 import scipy
@@ -53,6 +57,8 @@ def index_operator(data_dict, index, duplicate=False):
 
 @TRANSFORMS.register_module()
 class Collect(object):
+    deterministic = True
+
     def __init__(self, keys, offset_keys_dict=None, **kwargs):
         """
         e.g. Collect(keys=[coord], feat_keys=[coord, color])
@@ -80,6 +86,8 @@ class Collect(object):
 
 @TRANSFORMS.register_module()
 class Copy(object):
+    deterministic = True
+
     def __init__(self, keys_dict=None):
         if keys_dict is None:
             keys_dict = dict(coord="origin_coord", segment="origin_segment")
@@ -98,6 +106,8 @@ class Copy(object):
 
 @TRANSFORMS.register_module()
 class Update(object):
+    deterministic = True
+
     def __init__(self, keys_dict=None):
         if keys_dict is None:
             keys_dict = dict()
@@ -111,6 +121,8 @@ class Update(object):
 
 @TRANSFORMS.register_module()
 class ToTensor(object):
+    deterministic = True
+
     def __call__(self, data):
         if isinstance(data, torch.Tensor):
             return data
@@ -139,6 +151,8 @@ class ToTensor(object):
 
 @TRANSFORMS.register_module()
 class NormalizeColor(object):
+    deterministic = True
+
     def __call__(self, data_dict):
         if "color" in data_dict.keys():
             data_dict["color"] = data_dict["color"] / 255
@@ -147,6 +161,8 @@ class NormalizeColor(object):
 
 @TRANSFORMS.register_module()
 class NormalizeCoord(object):
+    deterministic = True
+
     def __call__(self, data_dict):
         print("NormalizeCoord start")
         print("input shape : "+str(len(data_dict["coord"])))
@@ -167,6 +183,8 @@ class NormalizeCoord(object):
 
 @TRANSFORMS.register_module()
 class PositiveShift(object):
+    deterministic = True
+
     def __call__(self, data_dict):
         if "coord" in data_dict.keys():
             coord_min = np.min(data_dict["coord"], 0)
@@ -176,6 +194,8 @@ class PositiveShift(object):
 
 @TRANSFORMS.register_module()
 class CenterShift(object):
+    deterministic = True
+
     def __init__(self, apply_z=True):
         self.apply_z = apply_z
 
@@ -207,6 +227,8 @@ class RandomShift(object):
 
 @TRANSFORMS.register_module()
 class PointClip(object):
+    deterministic = True
+
     def __init__(self, point_cloud_range=(-80, -80, -3, 80, 80, 1)):
         self.point_cloud_range = point_cloud_range
 
@@ -816,16 +838,24 @@ class GridSample(object):
         return_min_coord=False,
         return_displacement=False,
         project_displacement=False,
+        max_parts=None,
+        coverage=None,
     ):
         self.grid_size = grid_size
         self.hash = self.fnv_hash_vec if hash_type == "fnv" else self.ravel_hash_vec
         assert mode in ["train", "test"]
         self.mode = mode
+        # train mode randomly selects a point in each grid
+        self.deterministic = mode == "test"
         self.return_inverse = return_inverse
         self.return_grid_coord = return_grid_coord
         self.return_min_coord = return_min_coord
         self.return_displacement = return_displacement
         self.project_displacement = project_displacement
+        # test mode emits count.max() parts by default, bound the number of parts by
+        # max_parts and / or stop once a fraction (coverage) of the points is covered
+        self.max_parts = max_parts
+        self.coverage = coverage
 
     def __call__(self, data_dict):
         assert "coord" in data_dict.keys()
@@ -878,7 +908,8 @@ class GridSample(object):
 
         elif self.mode == "test":  # test mode
             data_part_list = []
-            for i in range(count.max()):
+            num_parts = self.num_parts(count)
+            for i in range(num_parts):
                 idx_select = np.cumsum(np.insert(count, 0, 0)[0:-1]) + i % count
                 idx_part = idx_sort[idx_select]
                 data_part = index_operator(data_dict, idx_part, duplicate=True)
@@ -904,10 +935,33 @@ class GridSample(object):
                     if "displacement" not in data_part["index_valid_keys"]:
                         data_part["index_valid_keys"].append("displacement")
                 data_part_list.append(data_part)
+            if num_parts < count.max():
+                # uncovered points take the prediction of a covered point of the same
+                # voxel, recorded in the first part and applied by the tester
+                start = np.cumsum(np.insert(count, 0, 0)[0:-1])[inverse]
+                ordinal = np.arange(len(idx_sort)) - start
+                mask = ordinal >= num_parts
+                data_part_list[0]["fill_index"] = idx_sort[mask]
+                data_part_list[0]["fill_source"] = idx_sort[
+                    start[mask] + ordinal[mask] % num_parts
+                ]
             return data_part_list
         else:
             raise NotImplementedError
 
+    def num_parts(self, count):
+        num_parts = count.max()
+        if self.max_parts is not None:
+            num_parts = min(num_parts, self.max_parts)
+        if self.coverage is not None:
+            # points covered by the first k parts: sum(min(count, k))
+            covered = np.cumsum(count.size - np.cumsum(np.bincount(count))[:-1])
+            num_parts = min(
+                num_parts,
+                np.searchsorted(covered, self.coverage * covered[-1]) + 1,
+            )
+        return int(num_parts)
+
     @staticmethod
     def ravel_hash_vec(arr):
         """
@@ -950,6 +1004,7 @@ class SphereCrop(object):
     def __init__(self, point_max=80000, sample_rate=None, mode="random"):
         self.point_max = point_max
         self.sample_rate = sample_rate
+        # mode "all" (test_crop) returns a list of overlapping crops covering all points
         assert mode in ["random", "center", "all"]
         self.mode = mode
 
@@ -961,6 +1016,8 @@ class SphereCrop(object):
         )
 
         assert "coord" in data_dict.keys()
+        if self.mode == "all":
+            return self.crop_all(data_dict, point_max)
         if data_dict["coord"].shape[0] > point_max:
             if self.mode == "random":
                 center = data_dict["coord"][
@@ -976,6 +1033,32 @@ class SphereCrop(object):
             data_dict = index_operator(data_dict, idx_crop)
         return data_dict
 
+    @staticmethod
+    def crop_all(data_dict, point_max):
+        # e.g. a sample_rate so small that int(sample_rate * n) == 0
+        assert point_max > 0, f"SphereCrop needs point_max > 0, got {point_max}."
+        coord = data_dict["coord"]
+        if "index" not in data_dict.keys():
+            data_dict["index"] = np.arange(coord.shape[0])
+        if coord.shape[0] <= point_max:
+            return [data_dict]
+        data_part_list = []
+        covered = np.zeros(coord.shape[0], dtype=bool)
+        # sliding from a corner, the next crop is centered at the uncovered point
+        # nearest to the center of the last crop
+        center = np.argmin(coord.sum(1))
+        while True:
+            dist2 = np.sum(np.square(coord - coord[center]), 1)
+            idx_crop = np.argpartition(dist2, point_max - 1)[:point_max]
+            data_part = index_operator(data_dict, idx_crop, duplicate=True)
+            data_part["index"] = data_dict["index"][idx_crop]
+            data_part_list.append(data_part)
+            covered[idx_crop] = True
+            if covered.all():
+                return data_part_list
+            dist2[covered] = np.inf
+            center = np.argmin(dist2)
+
 
 @TRANSFORMS.register_module()
 class ShufflePoint(object):
@@ -989,6 +1072,8 @@ class ShufflePoint(object):
 
 @TRANSFORMS.register_module()
 class CropBoundary(object):
+    deterministic = True
+
     def __call__(self, data_dict):
         assert "segment" in data_dict
         segment = data_dict["segment"].flatten()
@@ -1144,6 +1229,8 @@ class MultiViewGenerator(object):
 
 @TRANSFORMS.register_module()
 class InstanceParser(object):
+    deterministic = True
+
     def __init__(self, segment_ignore_index=(-1, 0, 1), instance_ignore_index=-1):
         self.segment_ignore_index = segment_ignore_index
         self.instance_ignore_index = instance_ignore_index
@@ -1190,13 +1277,61 @@ class InstanceParser(object):
 
 
 class Compose(object):
-    def __init__(self, cfg=None):
+    def __init__(self, cfg=None, cache_dir=None):
+        """
+        cache_dir: cache the output of the deterministic prefix of transforms per
+        sample, see `cached_call`. Transforms declare themselves deterministic
+        (attribute `deterministic`), or configs mark them with `deterministic=True`
+        (e.g. accept a fixed GridSample(mode="train") for validation) or cut the
+        prefix earlier with `deterministic=False`. Use a folder under /dev/shm to
+        keep the cache in shared memory.
+        """
         self.cfg = cfg if cfg is not None else []
         self.transforms = []
         for t_cfg in self.cfg:
-            self.transforms.append(TRANSFORMS.build(t_cfg))
-
-    def __call__(self, data_dict):
+            t_cfg = dict(t_cfg)
+            deterministic = t_cfg.pop("deterministic", None)
+            t = TRANSFORMS.build(t_cfg)
+            if deterministic is not None:
+                t.deterministic = deterministic
+            self.transforms.append(t)
+        self.cache_dir = cache_dir
+        self.num_deterministic = 0
         for t in self.transforms:
+            if not getattr(t, "deterministic", False):
+                break
+            self.num_deterministic += 1
+        prefix = json.dumps(
+            list(self.cfg[: self.num_deterministic]), sort_keys=True, default=str
+        )
+        self.cache_hash = hashlib.md5(prefix.encode()).hexdigest()
+
+    def __call__(self, data_dict, start=0):
+        for t in self.transforms[start:]:
             data_dict = t(data_dict)
         return data_dict
+
+    def cached_call(self, identity, load_fn):
+        """
+        Run the pipeline on `load_fn()`. The output of the deterministic prefix is
+        stored under cache_dir keyed by `identity` (file identity of the sample) and
+        the config hash of the prefix, later calls skip both loading and prefix.
+        """
+        if self.cache_dir is None or self.num_deterministic == 0:
+            return self(load_fn())
+        name = hashlib.md5(identity.encode()).hexdigest()
+        path = os.path.join(self.cache_dir, self.cache_hash, f"{name}.pkl")
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                data_dict = pickle.load(f)
+        else:
+            data_dict = load_fn()
+            for t in self.transforms[: self.num_deterministic]:
+                data_dict = t(data_dict)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a process unique temp file then rename, safe for workers
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(data_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        return self(data_dict, start=self.num_deterministic)
@@ -5,12 +5,38 @@ Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
 Please cite our work if the code is helpful to you.
 """
 
+import os
+import math
+import pickle
 import random
+import shutil
 from collections.abc import Mapping, Sequence
 import numpy as np
 import torch
 from torch.utils.data.dataloader import default_collate
 
+import pointcept.utils.comm as comm
+
+
+def shared_cat(tensors):
+    """
+    concatenate tensors along dim 0, inside a DataLoader worker the output is
+    allocated in shared memory, so sending the batch to the main process only
+    passes a handle instead of copying the whole batch into shared memory again
+    """
+    elem = tensors[0]
+    out = None
+    if (
+        torch.utils.data.get_worker_info() is not None
+        and elem.dim() > 0
+        and all(t.dtype == elem.dtype for t in tensors)
+    ):
+        length = sum(t.shape[0] for t in tensors)
+        numel = length * math.prod(elem.shape[1:])
+        storage = elem._typed_storage()._new_shared(numel, device=elem.device)
+        out = elem.new(storage).resize_(length, *elem.shape[1:])
+    return torch.cat(tensors, out=out)
+
 
 def collate_fn(batch):
     """
@@ -21,7 +47,7 @@ def collate_fn(batch):
         raise TypeError(f"{batch.dtype} is not supported.")
 
     if isinstance(batch[0], torch.Tensor):
-        return torch.cat(list(batch))
+        return shared_cat(list(batch))
     elif isinstance(batch[0], str):
         # str is also a kind of Sequence, judgement should before Sequence
         return list(batch)
@@ -75,3 +101,96 @@ def point_collate_fn(batch, mix_prob=0):
 
 def gaussian_kernel(dist2: np.array, a: float = 1, c: float = 5):
     return a * np.exp(-dist2 / (2 * c**2))
+
+
+def save_packed(path, sample_list, extra=None):
+    """
+    save a list of dicts into folder `path`, tensors and arrays are concatenated per
+    key into one .npy file (memory-mappable), other values and `extra` are pickled in
+    meta.pkl, the folder is written aside and renamed (safe for concurrent writers)
+    """
+    meta = dict(
+        extra=extra,
+        keys=dict(),
+        other=[dict() for _ in sample_list],
+    )
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    for key in sample_list[0].keys():
+        values = [sample.get(key) for sample in sample_list]
+        if all(isinstance(v, torch.Tensor) and v.dim() > 0 for v in values):
+            kind, values = "tensor", [v.numpy() for v in values]
+        elif all(isinstance(v, np.ndarray) and v.ndim > 0 for v in values):
+            kind = "array"
+        else:
+            for other, value in zip(meta["other"], values):
+                other[key] = value
+            continue
+        meta["keys"][key] = (kind, [len(v) for v in values])
+        np.save(os.path.join(tmp_path, f"{key}.npy"), np.concatenate(values))
+    with open(os.path.join(tmp_path, "meta.pkl"), "wb") as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # written by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_packed(path, mmap_mode="c"):
+    """
+    load sample list and extra saved by `save_packed`, samples are views of
+    memory-mapped files, pages are read from disk only when accessed and shared
+    by all processes mapping the same files
+    """
+    with open(os.path.join(path, "meta.pkl"), "rb") as f:
+        meta = pickle.load(f)
+    sample_list = [dict(other) for other in meta["other"]]
+    for key, (kind, lengths) in meta["keys"].items():
+        data = np.load(os.path.join(path, f"{key}.npy"), mmap_mode=mmap_mode)
+        start = 0
+        for sample, length in zip(sample_list, lengths):
+            value = data[start : start + length]
+            sample[key] = torch.from_numpy(value) if kind == "tensor" else value
+            start += length
+    return sample_list, meta["extra"]
+
+
+def packed_store(path, build_fn, sample_names=None):
+    """
+    open the packed sample store at `path` read-only, on first use it is built from
+    build_fn() (list of samples) by the local main process while other ranks wait.
+    `sample_names` (identifiers of the samples in order) is recorded in the store, a
+    store recorded with other names (e.g. changed split file) is rebuilt
+    """
+    if sample_names is not None:
+        sample_names = [str(name) for name in sample_names]
+    extra = dict(sample_names=sample_names)
+    if comm.get_local_rank() == 0:
+        if os.path.isdir(path) and load_packed(path, mmap_mode="r")[1] != extra:
+            shutil.rmtree(path)
+        if not os.path.isdir(path):
+            save_packed(path, build_fn(), extra=extra)
+    comm.synchronize()
+    sample_list, record = load_packed(path, mmap_mode="r")
+    assert record == extra, f"Packed store {path} does not match the sample list."
+    return sample_list
+
+
+def save_fragment_cache(path, result_dict):
+    """
+    save the output of prepare_test_data into folder `path` (see `save_packed`)
+    """
+    fragment_list = result_dict["fragment_list"]
+    result = {k: v for k, v in result_dict.items() if k != "fragment_list"}
+    save_packed(path, fragment_list, extra=result)
+
+
+def load_fragment_cache(path):
+    """
+    load result_dict saved by `save_fragment_cache`, fragments are views of
+    memory-mapped (copy-on-write) files, read from disk only when collated
+    """
+    fragment_list, result_dict = load_packed(path, mmap_mode="c")
+    result_dict["fragment_list"] = fragment_list
+    return result_dict
@@ -11,6 +11,7 @@ import os
 import sys
 import argparse
 import multiprocessing as mp
+import torch
 from torch.nn.parallel import DistributedDataParallel
 
 
@@ -31,7 +32,7 @@ def create_ddp_model(model, *, fp16_compression=False, **kwargs):
     if comm.get_world_size() == 1:
         return model
     # kwargs['find_unused_parameters'] = True
-    if "device_ids" not in kwargs:
+    if "device_ids" not in kwargs and comm.get_device().type == "cuda":
         kwargs["device_ids"] = [comm.get_local_rank()]
         if "output_device" not in kwargs:
             kwargs["output_device"] = [comm.get_local_rank()]
@@ -43,6 +44,56 @@ def create_ddp_model(model, *, fp16_compression=False, **kwargs):
     return ddp
 
 
+def compile_model(
+    model,
+    mode="default",
+    dynamic=True,
+    fullgraph=False,
+    backend="inductor",
+    modules=None,
+    criteria=False,
+    cache_dir=None,
+    suppress_errors=False,
+):
+    """
+    Compile a model in place with torch.compile.
+    Args:
+        model: a torch.nn.Module, compile before wrapping with DDP.
+        mode, dynamic, fullgraph, backend: arguments of torch.compile, dynamic shape
+            is enabled by default as point number varies from batch to batch.
+        modules: names of submodules (e.g. ["backbone"]) to compile individually,
+            default None compiles the whole model.
+        criteria: also compile losses of Criteria hold by model (model.criteria).
+        cache_dir: directory to persist compiled artifacts across runs.
+        suppress_errors: frames failing to compile fall back to eager instead of
+            raising error, note this sets torch._dynamo.config process-wide.
+
+    Modules are compiled in place (nn.Module.compile), so that state dict keys are
+    not changed. Graph breaks split the graph and run the unsupported part eagerly.
+    """
+    if cache_dir is not None:
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.abspath(cache_dir)
+    if backend == "inductor":
+        import torch._inductor.config
+
+        torch._inductor.config.fx_graph_cache = True
+    if suppress_errors:
+        torch._dynamo.config.suppress_errors = True
+    compile_kwargs = dict(
+        mode=mode, dynamic=dynamic, fullgraph=fullgraph, backend=backend
+    )
+    if modules is None:
+        model.compile(**compile_kwargs)
+    else:
+        for name in modules:
+            model.get_submodule(name).compile(**compile_kwargs)
+    if criteria and hasattr(model, "criteria"):
+        for loss in getattr(model.criteria, "criteria", []):
+            if isinstance(loss, torch.nn.Module):
+                loss.compile(**compile_kwargs)
+    return model
+
+
 def worker_init_fn(worker_id, num_workers, rank, seed):
     """Worker init func for dataloader.
 
@@ -100,6 +151,24 @@ def default_argument_parser(epilog=None):
         help="initialization URL for pytorch distributed backend. See "
         "https://pytorch.org/docs/stable/distributed.html for details.",
     )
+    parser.add_argument(
+        "--device",
+        default="cuda",
+        choices=["cuda", "cpu"],
+        help="run on gpus (nccl) or cpu processes (gloo), "
+        "with cpu --num-gpus is the number of processes per machine",
+    )
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=None,
+        help="intra-op threads of each cpu process",
+    )
+    parser.add_argument(
+        "--pin-cores",
+        action="store_true",
+        help="pin each cpu process to its share of cores (NUMA aware)",
+    )
     parser.add_argument(
         "--options", nargs="+", action=DictAction, help="custom options"
     )
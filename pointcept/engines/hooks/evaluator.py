@@ -31,7 +31,9 @@ class ClsEvaluator(HookBase):
         for i, input_dict in enumerate(self.trainer.val_loader):
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(
+                        comm.get_device(), non_blocking=True
+                    )
             with torch.no_grad():
                 output_dict = self.trainer.model(input_dict)
             output = output_dict["cls_logits"]
@@ -122,7 +124,9 @@ class SemSegEvaluator(HookBase):
         for i, input_dict in enumerate(self.trainer.val_loader):
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(
+                        comm.get_device(), non_blocking=True
+                    )
             with torch.no_grad():
                 output_dict = self.trainer.model(input_dict)
             output = output_dict["seg_logits"]
@@ -544,7 +548,9 @@ class InsSegEvaluator(HookBase):
             )  # currently only support bs 1 for each GPU
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(
+                        comm.get_device(), non_blocking=True
+                    )
             with torch.no_grad():
                 output_dict = self.trainer.model(input_dict)
 
@@ -11,10 +11,12 @@ import os
 import shutil
 import time
 import gc
+import copy
+import threading
+import queue
 import wandb
 import torch
 import torch.utils.data
-from collections import OrderedDict
 
 if sys.version_info >= (3, 10):
     from collections.abc import Sequence
@@ -23,6 +25,7 @@ else:
 from pointcept.utils.timer import Timer
 from pointcept.utils.comm import is_main_process, synchronize
 from pointcept.utils.cache import shared_dict
+from pointcept.utils.checkpoint import load_checkpoint, remap_state_dict
 from pointcept.utils.scheduler import CosineScheduler
 import pointcept.utils.comm as comm
 
@@ -79,9 +82,20 @@ class IterationTimer(HookBase):
 
 @HOOKS.register_module()
 class InformationWriter(HookBase):
-    def __init__(self):
+    def __init__(self, interval=1, seconds=None):
         self.curr_iter = 0
         self.model_output_keys = []
+        # model outputs are accumulated on device and flushed (one host sync) every
+        # `interval` steps or `seconds` seconds, tensorboard writes are issued by a
+        # background thread, wandb logs stay on the main thread to keep their step
+        # order with other hooks (e.g. evaluators)
+        self.interval = interval
+        self.seconds = seconds
+        self.accumulator = {}
+        self.num_steps = 0
+        self.last_flush = time.perf_counter()
+        self.queue = None
+        self.thread = None
 
     def before_train(self):
         self.trainer.comm_info["iter_info"] = ""
@@ -90,6 +104,10 @@ class InformationWriter(HookBase):
             wandb.define_metric("params/*", step_metric="Iter")
             wandb.define_metric("train_batch/*", step_metric="Iter")
             wandb.define_metric("train/*", step_metric="Epoch")
+        if self.trainer.writer is not None:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self.write_worker, daemon=True)
+            self.thread.start()
 
     def before_step(self):
         self.curr_iter += 1
@@ -106,69 +124,106 @@ class InformationWriter(HookBase):
             model_output_dict = self.trainer.comm_info["model_output_dict"]
             self.model_output_keys = model_output_dict.keys()
             for key in self.model_output_keys:
-                self.trainer.storage.put_scalar(key, model_output_dict[key].item())
+                value = model_output_dict[key].detach().float()
+                self.accumulator[key] = self.accumulator.get(key, 0) + value
+        self.num_steps += 1
+        if (
+            self.num_steps >= self.interval
+            or self.trainer.comm_info["iter"] + 1 == len(self.trainer.train_loader)
+            or (
+                self.seconds is not None
+                and time.perf_counter() - self.last_flush >= self.seconds
+            )
+        ):
+            self.flush()
+        self.trainer.comm_info["iter_info"] = ""  # reset iter info
 
-        for key in self.model_output_keys:
+    def flush(self):
+        if self.num_steps == 0:
+            return
+        keys = list(self.accumulator.keys())
+        values = (
+            (torch.stack([self.accumulator[key] for key in keys]) / self.num_steps)
+            .cpu()
+            .tolist()
+            if len(keys) > 0
+            else []
+        )
+        scalars = {"params/lr": self.trainer.optimizer.param_groups[0]["lr"]}
+        for key, value in zip(keys, values):
+            # mean over the flushed steps, weighted by the number of steps
+            self.trainer.storage.put_scalar(key, value, n=self.num_steps)
             self.trainer.comm_info["iter_info"] += "{key}: {value:.4f} ".format(
-                key=key, value=self.trainer.storage.history(key).val
+                key=key, value=value
             )
-        lr = self.trainer.optimizer.state_dict()["param_groups"][0]["lr"]
-        self.trainer.comm_info["iter_info"] += "Lr: {lr:.5f}".format(lr=lr)
+            scalars[f"train_batch/{key}"] = value
+        self.trainer.comm_info["iter_info"] += "Lr: {lr:.5f}".format(
+            lr=scalars["params/lr"]
+        )
         self.trainer.logger.info(self.trainer.comm_info["iter_info"])
-        self.trainer.comm_info["iter_info"] = ""  # reset iter info
-        if self.trainer.writer is not None:
-            self.trainer.writer.add_scalar("params/lr", lr, self.curr_iter)
-            for key in self.model_output_keys:
-                self.trainer.writer.add_scalar(
-                    "train_batch/" + key,
-                    self.trainer.storage.history(key).val,
-                    self.curr_iter,
-                )
-            if self.trainer.cfg.enable_wandb:
+        self.write(scalars, self.curr_iter, "Iter")
+        self.accumulator = {}
+        self.num_steps = 0
+        self.last_flush = time.perf_counter()
+
+    def write(self, scalars, step, step_metric):
+        if self.queue is None:
+            return
+
+        def write_fn():
+            for tag, value in scalars.items():
+                self.trainer.writer.add_scalar(tag, value, step)
+
+        self.queue.put(write_fn)
+        if self.trainer.cfg.enable_wandb:
+            # iteration logs drive the wandb step, epoch logs attach to it
+            wandb.log(
+                {step_metric: step, **scalars},
+                step=step if step_metric == "Iter" else wandb.run.step,
+            )
 
-                wandb.log(
-                    {"Iter": self.curr_iter, "params/lr": lr}, step=self.curr_iter
-                )
-                for key in self.model_output_keys:
-                    wandb.log(
-                        {
-                            "Iter": self.curr_iter,
-                            f"train_batch/{key}": self.trainer.storage.history(key).val,
-                        },
-                        step=wandb.run.step,
-                    )
+    def write_worker(self):
+        while True:
+            write_fn = self.queue.get()
+            if write_fn is None:
+                break
+            try:
+                write_fn()
+            except Exception:
+                self.trainer.logger.exception("Failed to write training information")
 
     def after_epoch(self):
+        self.flush()
         epoch_info = "Train result: "
         for key in self.model_output_keys:
             epoch_info += "{key}: {value:.4f} ".format(
                 key=key, value=self.trainer.storage.history(key).avg
             )
         self.trainer.logger.info(epoch_info)
-        if self.trainer.writer is not None:
-            for key in self.model_output_keys:
-                self.trainer.writer.add_scalar(
-                    "train/" + key,
-                    self.trainer.storage.history(key).avg,
-                    self.trainer.epoch + 1,
-                )
-
-            if self.trainer.cfg.enable_wandb:
+        self.write(
+            {
+                f"train/{key}": self.trainer.storage.history(key).avg
+                for key in self.model_output_keys
+            },
+            self.trainer.epoch + 1,
+            "Epoch",
+        )
 
-                for key in self.model_output_keys:
-                    wandb.log(
-                        {
-                            "Epoch": self.trainer.epoch + 1,
-                            f"train/{key}": self.trainer.storage.history(key).avg,
-                        },
-                        step=wandb.run.step,
-                    )
+    def after_train(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
 
 
 @HOOKS.register_module()
 class CheckpointSaver(HookBase):
-    def __init__(self, save_freq=None):
+    def __init__(self, save_freq=None, async_save=False):
         self.save_freq = save_freq  # None or int, None indicate only save model last
+        # async_save: snapshot states to cpu and write checkpoint in a background
+        # thread, at most one save is in flight
+        self.async_save = async_save
+        self.save_thread = None
+        self.save_exception = None
 
     def after_epoch(self):
         if is_main_process():
@@ -190,40 +245,98 @@ class CheckpointSaver(HookBase):
                     )
                 )
 
-            filename = os.path.join(
-                self.trainer.cfg.save_path, "model", "model_last.pth"
-            )
-            self.trainer.logger.info("Saving checkpoint to: " + filename)
-            torch.save(
-                {
-                    "epoch": self.trainer.epoch + 1,
-                    "state_dict": self.trainer.model.state_dict(),
-                    "optimizer": self.trainer.optimizer.state_dict(),
-                    "scheduler": self.trainer.scheduler.state_dict(),
-                    "scaler": (
-                        self.trainer.scaler.state_dict()
-                        if self.trainer.cfg.enable_amp
-                        else None
-                    ),
-                    "best_metric_value": self.trainer.best_metric_value,
-                },
-                filename + ".tmp",
-            )
-            os.replace(filename + ".tmp", filename)
+            model_dir = os.path.join(self.trainer.cfg.save_path, "model")
+            filename = os.path.join(model_dir, "model_last.pth")
+            alias = []
             if is_best:
-                shutil.copyfile(
-                    filename,
-                    os.path.join(self.trainer.cfg.save_path, "model", "model_best.pth"),
-                )
+                alias.append(os.path.join(model_dir, "model_best.pth"))
             if self.save_freq and (self.trainer.epoch + 1) % self.save_freq == 0:
-                shutil.copyfile(
-                    filename,
-                    os.path.join(
-                        self.trainer.cfg.save_path,
-                        "model",
-                        f"epoch_{self.trainer.epoch + 1}.pth",
-                    ),
+                alias.append(
+                    os.path.join(model_dir, f"epoch_{self.trainer.epoch + 1}.pth")
+                )
+            checkpoint = {
+                "epoch": self.trainer.epoch + 1,
+                "state_dict": self.trainer.model.state_dict(),
+                "optimizer": self.trainer.optimizer.state_dict(),
+                "scheduler": self.trainer.scheduler.state_dict(),
+                "scaler": (
+                    self.trainer.scaler.state_dict()
+                    if self.trainer.cfg.enable_amp
+                    else None
+                ),
+                "best_metric_value": self.trainer.best_metric_value,
+            }
+            self.trainer.logger.info("Saving checkpoint to: " + filename)
+            if self.async_save:
+                # states are updated in place by the next step, copy them first
+                self.wait()
+                checkpoint = self.snapshot(checkpoint)
+                self.save_thread = threading.Thread(
+                    target=self.save, args=(checkpoint, filename, alias)
                 )
+                self.save_thread.start()
+            else:
+                self.save(checkpoint, filename, alias)
+
+    def after_train(self):
+        if is_main_process():
+            self.wait()
+
+    def wait(self):
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+        if self.save_exception is not None:
+            exception, self.save_exception = self.save_exception, None
+            raise exception
+
+    @classmethod
+    def snapshot(cls, state):
+        if isinstance(state, torch.Tensor):
+            return state.detach().to("cpu", copy=True)
+        elif isinstance(state, dict):
+            snapshot = type(state)(
+                (key, cls.snapshot(value)) for key, value in state.items()
+            )
+            if hasattr(state, "_metadata"):
+                # module version info of state_dict, used by load_state_dict
+                snapshot._metadata = copy.deepcopy(state._metadata)
+            return snapshot
+        elif isinstance(state, tuple) and hasattr(state, "_fields"):
+            # namedtuple
+            return type(state)(*(cls.snapshot(value) for value in state))
+        elif isinstance(state, (list, tuple)):
+            return type(state)(cls.snapshot(value) for value in state)
+        else:
+            return copy.deepcopy(state)
+
+    @staticmethod
+    def link(src, dst):
+        # checkpoints are never modified in place (always replaced), so alias
+        # with hard link instead of copy, fall back to copy if not supported
+        try:
+            os.link(src, dst + ".tmp")
+        except OSError:
+            shutil.copyfile(src, dst + ".tmp")
+        os.replace(dst + ".tmp", dst)
+
+    def save(self, checkpoint, filename, alias):
+        try:
+            torch.save(checkpoint, filename + ".tmp")
+            os.replace(filename + ".tmp", filename)
+            for path in alias:
+                if os.path.exists(path + ".tmp"):
+                    os.remove(path + ".tmp")
+                self.link(filename, path)
+            # commit marker, record the epoch of checkpoint which is fully written
+            marker = os.path.join(os.path.dirname(filename), "last_commit.txt")
+            with open(marker + ".tmp", "w") as f:
+                f.write(f"{checkpoint['epoch']}\n")
+            os.replace(marker + ".tmp", marker)
+        except Exception as e:
+            if not self.async_save:
+                raise
+            self.save_exception = e
 
 
 @HOOKS.register_module()
@@ -237,25 +350,17 @@ class CheckpointLoader(HookBase):
         self.trainer.logger.info("=> Loading checkpoint & weight ...")
         if self.trainer.cfg.weight and os.path.isfile(self.trainer.cfg.weight):
             self.trainer.logger.info(f"Loading weight at: {self.trainer.cfg.weight}")
-            checkpoint = torch.load(
-                self.trainer.cfg.weight,
-                map_location=lambda storage, loc: storage.cuda(),
-                weights_only=False,
-            )
+            checkpoint = load_checkpoint(self.trainer.cfg.weight)
             self.trainer.logger.info(
                 f"Loading layer weights with keyword: {self.keywords}, "
                 f"replace keyword with: {self.replacement}"
             )
-            weight = OrderedDict()
-            for key, value in checkpoint["state_dict"].items():
-                if not key.startswith("module."):
-                    key = "module." + key  # xxx.xxx -> module.xxx.xxx
-                # Now all keys contain "module." no matter DDP or not.
-                if self.keywords in key:
-                    key = key.replace(self.keywords, self.replacement, 1)
-                if comm.get_world_size() == 1:
-                    key = key[7:]  # module.xxx.xxx -> xxx.xxx
-                weight[key] = value
+            weight = remap_state_dict(
+                checkpoint["state_dict"],
+                ddp=comm.get_world_size() > 1,
+                keywords=self.keywords,
+                replacement=self.replacement,
+            )
             load_state_info = self.trainer.model.load_state_dict(
                 weight, strict=self.strict
             )
@@ -296,15 +401,10 @@ class PreciseEvaluator(HookBase):
             best_path = os.path.join(
                 self.trainer.cfg.save_path, "model", "model_best.pth"
             )
-            checkpoint = torch.load(best_path, weights_only=False)
-            weight = OrderedDict()
-            for key, value in checkpoint["state_dict"].items():
-                if not key.startswith("module."):
-                    key = "module." + key  # xxx.xxx -> module.xxx.xxx
-                # Now all keys contain "module." no matter DDP or not.
-                if comm.get_world_size() == 1:
-                    key = key[7:]  # module.xxx.xxx -> xxx.xxx
-                weight[key] = value
+            checkpoint = load_checkpoint(best_path)
+            weight = remap_state_dict(
+                checkpoint["state_dict"], ddp=comm.get_world_size() > 1
+            )
             tester.model.load_state_dict(weight, strict=True)
         tester.test()
 
@@ -371,7 +471,9 @@ class RuntimeProfiler(HookBase):
                 break
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(
+                        comm.get_device(), non_blocking=True
+                    )
             if self.forward:
                 with profile(
                     activities=[ProfilerActivity.CPU, ProfilerActivity.CUDA],
@@ -472,7 +574,9 @@ class RuntimeProfilerV2(HookBase):
                 break
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(
+                        comm.get_device(), non_blocking=True
+                    )
             with record_function("model_forward"):
                 output_dict = self.trainer.model(input_dict)
                 loss = output_dict["loss"]
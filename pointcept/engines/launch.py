@@ -8,6 +8,7 @@ Please cite our work if the code is helpful to you.
 """
 
 import os
+import glob
 import logging
 from datetime import timedelta
 import torch
@@ -33,6 +34,50 @@ def _find_free_port():
     return port
 
 
+def _parse_cpu_list(cpu_list):
+    # "0-3,8-11" -> [0, 1, 2, 3, 8, 9, 10, 11]
+    cores = []
+    for part in cpu_list.strip().split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cores.extend(range(int(start), int(end) + 1))
+        elif part:
+            cores.append(int(part))
+    return cores
+
+
+def _available_cores():
+    """
+    Cores available to the current process, grouped by NUMA node first.
+    """
+    available = os.sched_getaffinity(0)
+    cores = []
+    for node in sorted(
+        glob.glob("/sys/devices/system/node/node[0-9]*"),
+        key=lambda x: int(x.split("node")[-1]),
+    ):
+        with open(os.path.join(node, "cpulist")) as f:
+            cores.extend(c for c in _parse_cpu_list(f.read()) if c in available)
+    # fall back to a single node if the topology is unavailable
+    if len(set(cores)) != len(available):
+        cores = sorted(available)
+    return cores
+
+
+def _setup_cpu_worker(local_rank, local_size, num_threads=None, pin_cores=False):
+    """
+    Split the cores of the machine to the local processes. Consecutive cores in NUMA
+    node order are assigned to each process, so that a process stays in one node
+    when the number of processes is a multiple of the number of nodes.
+    """
+    cores = _available_cores()
+    chunk = max(len(cores) // local_size, 1)
+    assigned = cores[local_rank * chunk : (local_rank + 1) * chunk] or cores
+    if pin_cores:
+        os.sched_setaffinity(0, assigned)
+    torch.set_num_threads(num_threads if num_threads is not None else len(assigned))
+
+
 def launch(
     main_func,
     num_gpus_per_machine,
@@ -41,6 +86,9 @@ def launch(
     dist_url=None,
     cfg=(),
     timeout=DEFAULT_TIMEOUT,
+    device="cuda",
+    num_threads=None,
+    pin_cores=False,
 ):
     """
     Launch multi-gpu or distributed training.
@@ -56,7 +104,13 @@ def launch(
                        Can be set to "auto" to automatically select a free port on localhost
         timeout (timedelta): timeout of the distributed workers
         args (tuple): arguments passed to main_func
+        device (str): "cuda" or "cpu", with "cpu" processes communicate with gloo
+                      and ``num_gpus_per_machine`` is the number of processes
+        num_threads (int): intra-op threads of each cpu process, default using all
+                       cores assigned to the process
+        pin_cores (bool): pin each cpu process to its share of (NUMA ordered) cores
     """
+    assert device in ["cuda", "cpu"]
     world_size = num_machines * num_gpus_per_machine
     if world_size > 1:
         if dist_url == "auto":
@@ -82,10 +136,16 @@ def launch(
                 dist_url,
                 cfg,
                 timeout,
+                device,
+                num_threads,
+                pin_cores,
             ),
             daemon=False,
         )
     else:
+        comm._DEVICE_TYPE = device
+        if device == "cpu":
+            _setup_cpu_worker(0, 1, num_threads, pin_cores)
         main_func(*cfg)
 
 
@@ -98,14 +158,20 @@ def _distributed_worker(
     dist_url,
     cfg,
     timeout=DEFAULT_TIMEOUT,
+    device="cuda",
+    num_threads=None,
+    pin_cores=False,
 ):
-    assert (
+    assert device == "cpu" or (
         torch.cuda.is_available()
     ), "cuda is not available. Please check your installation."
+    comm._DEVICE_TYPE = device
+    if device == "cpu":
+        _setup_cpu_worker(local_rank, num_gpus_per_machine, num_threads, pin_cores)
     global_rank = machine_rank * num_gpus_per_machine + local_rank
     try:
         dist.init_process_group(
-            backend="NCCL",
+            backend="NCCL" if device == "cuda" else "GLOO",
             init_method=dist_url,
             world_size=world_size,
             rank=global_rank,
@@ -127,8 +193,9 @@ def _distributed_worker(
         if i == machine_rank:
             comm._LOCAL_PROCESS_GROUP = pg
 
-    assert num_gpus_per_machine <= torch.cuda.device_count()
-    torch.cuda.set_device(local_rank)
+    if device == "cuda":
+        assert num_gpus_per_machine <= torch.cuda.device_count()
+        torch.cuda.set_device(local_rank)
 
     # synchronize is needed here to prevent a possible timeout after calling init_process_group
     # See: https://github.com/facebookresearch/maskrcnn-benchmark/issues/172
@@ -0,0 +1,297 @@
+"""
+Server
+
+Keep a warm semantic segmentation model in memory and answer point cloud requests
+over HTTP. Requests are preprocessed with the test pipeline of the config in the
+handler threads, and fragments of concurrent requests are batched together up to a
+point budget before each forward pass.
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import io
+import os
+import json
+import inspect
+import queue
+import threading
+import time
+import numpy as np
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import torch
+import torch.nn.functional as F
+
+from .test import TesterBase, FragmentFill
+from pointcept.datasets import collate_fn
+from pointcept.datasets.transform import Compose, TRANSFORMS
+
+try:
+    import laspy
+except ImportError:
+    laspy = None
+
+
+class ServeRequest:
+    def __init__(
+        self, num_points, num_classes, num_fragments, device, inverse=None, fill=None
+    ):
+        self.pred = torch.zeros((num_points, num_classes), device=device)
+        self.remain = num_fragments
+        self.inverse = inverse
+        self.fill = FragmentFill(fill if fill is not None else {}, device)
+        self.pred = self.fill(self.pred, 0)
+        self.num_done = 0
+        self.done = threading.Event()
+        self.error = None
+        if num_fragments == 0:
+            self.done.set()
+
+    def finish(self, error=None):
+        # a failed request is finished once, its remaining fragments are skipped
+        if self.done.is_set():
+            return
+        self.error = error
+        self.done.set()
+
+
+class SemSegServer(TesterBase):
+    """
+    Serve SemSegTester's model.
+
+    POST /predict with either a npz body holding point arrays (coord, color, normal,
+    strength, ...) or a json body {"path": ...} pointing to a .npz / .las file or a
+    folder of .npy assets (DefaultDataset layout). Responds a npz with per-point
+    "pred" labels, and "prob" (softmax accumulated over fragments) with `?prob=1`.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8000,
+        max_points=400000,
+        max_wait=0.01,
+        **kwargs,
+    ):
+        # cfg.test may carry options of the configured tester (e.g. SemSegTester's
+        # reuse_neighbours, memory_budget), keep those TesterBase understands
+        params = inspect.signature(TesterBase.__init__).parameters
+        ignored = [key for key in kwargs.keys() if key not in params]
+        kwargs = {key: value for key, value in kwargs.items() if key in params}
+        super().__init__(**kwargs)
+        if ignored:
+            self.logger.info(f"Ignored test options not used by server: {ignored}")
+        self.host = host
+        self.port = port
+        self.max_points = max_points  # point budget of each forward pass
+        self.max_wait = max_wait  # seconds waiting for more fragments to batch
+        self.transform = Compose(self.cfg.data.test.transform)
+        test_cfg = self.cfg.data.test.test_cfg
+        self.test_voxelize = TRANSFORMS.build(test_cfg.voxelize)
+        self.test_crop = TRANSFORMS.build(test_cfg.crop) if test_cfg.crop else None
+        self.post_transform = Compose(test_cfg.post_transform)
+        self.aug_transform = [Compose(aug) for aug in test_cfg.aug_transform]
+        self.queue = queue.Queue()
+        self.model.eval()
+
+    def build_test_loader(self):
+        # requests come from http instead of the test split
+        return None
+
+    def load(self, path):
+        data_dict = {}
+        if os.path.isdir(path):
+            for asset in os.listdir(path):
+                if asset.endswith(".npy"):
+                    data_dict[asset[:-4]] = np.load(os.path.join(path, asset))
+        elif path.endswith(".npz"):
+            data_dict = dict(np.load(path))
+        elif path.endswith((".las", ".laz")):
+            assert laspy is not None, "Please install laspy to load las file."
+            las = laspy.read(path)
+            data_dict["coord"] = np.stack([las.x, las.y, las.z], axis=-1)
+            if {"red", "green", "blue"}.issubset(las.point_format.dimension_names):
+                color = np.stack([las.red, las.green, las.blue], axis=-1)
+                # las stores 16 bit color
+                data_dict["color"] = color / 65535 * 255 if color.max() > 255 else color
+            data_dict["strength"] = np.asarray(las.intensity).reshape([-1, 1])
+        else:
+            raise ValueError(f"Unsupported file: {path}")
+        return data_dict
+
+    def prepare(self, data_dict):
+        # keep in line with DefaultDataset.get_data and prepare_test_data
+        for key in ["coord", "color", "normal", "strength"]:
+            if key in data_dict.keys():
+                data_dict[key] = data_dict[key].astype(np.float32)
+        num_points = data_dict["coord"].shape[0]
+        data_dict["segment"] = np.ones(num_points, dtype=np.int32) * -1
+        data_dict["name"] = "request"
+        data_dict = self.transform(data_dict)
+        data_dict.pop("segment")
+        data_dict.pop("name")
+        inverse = None
+        if "origin_segment" in data_dict:
+            data_dict.pop("origin_segment")
+            inverse = data_dict.pop("inverse")
+        fragment_list = []
+        fill = dict(fill_index=[], fill_source=[], fill_offset=[], fill_fragment=[])
+        for aug in self.aug_transform:
+            data = aug(deepcopy(data_dict))
+            start = len(fragment_list)
+            if self.test_voxelize is not None:
+                data_part_list = self.test_voxelize(data)
+                if "fill_index" in data_part_list[0]:
+                    for key in ["fill_index", "fill_source"]:
+                        fill[key].append(data_part_list[0].pop(key))
+            else:
+                data["index"] = np.arange(data["coord"].shape[0])
+                data_part_list = [data]
+            for data_part in data_part_list:
+                if self.test_crop is not None:
+                    fragment_list += self.test_crop(data_part)
+                else:
+                    fragment_list.append(data_part)
+            if len(fill["fill_index"]) > len(fill["fill_fragment"]):
+                fill["fill_fragment"].append([start, len(fragment_list)])
+        fragment_list = [self.post_transform(f) for f in fragment_list]
+        num_points = data_dict["coord"].shape[0]
+        if fill["fill_index"]:
+            fill["fill_offset"] = np.cumsum([len(i) for i in fill["fill_index"]])
+            fill["fill_fragment"] = np.array(fill["fill_fragment"])
+            fill["fill_index"] = np.concatenate(fill["fill_index"])
+            fill["fill_source"] = np.concatenate(fill["fill_source"])
+        else:
+            fill = {}
+        return fragment_list, num_points, inverse, fill
+
+    def predict(self, data_dict, return_prob=False):
+        fragment_list, num_points, inverse, fill = self.prepare(data_dict)
+        request = ServeRequest(
+            num_points,
+            self.cfg.data.num_classes,
+            len(fragment_list),
+            self.device,
+            inverse,
+            fill,
+        )
+        for fragment in fragment_list:
+            self.queue.put((request, fragment))
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        prob = request.pred
+        prob = prob / prob.sum(-1, keepdim=True).clamp(min=1e-12)
+        prob = prob.cpu().numpy()
+        if inverse is not None:
+            prob = prob[inverse]
+        result = dict(pred=prob.argmax(-1))
+        if return_prob:
+            result["prob"] = prob
+        return result
+
+    def next_batch(self, pending):
+        # gather fragments of queued requests up to the point budget,
+        # skipping fragments of requests already finished (failed)
+        while pending is None or pending[0].done.is_set():
+            pending = self.queue.get()
+        batch = [pending]
+        num_points = batch[0][1]["coord"].shape[0]
+        deadline = time.time() + self.max_wait
+        while num_points < self.max_points:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                return batch, None
+            if item[0].done.is_set():
+                continue
+            if num_points + item[1]["coord"].shape[0] > self.max_points:
+                return batch, item
+            batch.append(item)
+            num_points += item[1]["coord"].shape[0]
+        return batch, None
+
+    def run_batch(self, batch):
+        batch = [item for item in batch if not item[0].done.is_set()]
+        if len(batch) == 0:
+            return
+        input_dict = collate_fn([fragment for _, fragment in batch])
+        for key in input_dict.keys():
+            if isinstance(input_dict[key], torch.Tensor):
+                input_dict[key] = input_dict[key].to(self.device, non_blocking=True)
+        with torch.no_grad():
+            pred_part = self.model(input_dict)["seg_logits"]
+            pred_part = F.softmax(pred_part, -1)
+        bs = 0
+        for (request, _), be in zip(batch, input_dict["offset"]):
+            request.pred[input_dict["index"][bs:be]] += pred_part[bs:be]
+            request.num_done += 1
+            request.pred = request.fill(request.pred, request.num_done)
+            bs = be
+            request.remain -= 1
+            if request.remain == 0:
+                request.finish()
+
+    def worker(self):
+        pending = None
+        while True:
+            batch, pending = self.next_batch(pending)
+            try:
+                self.run_batch(batch)
+            except Exception as e:
+                self.logger.exception("Inference failed")
+                for request, _ in batch:
+                    request.finish(e)
+            if self.cfg.empty_cache and self.device.type == "cuda":
+                torch.cuda.empty_cache()
+
+    def test(self):
+        self.serve()
+
+    def serve(self):
+        threading.Thread(target=self.worker, daemon=True).start()
+        server = ThreadingHTTPServer((self.host, self.port), self.build_handler())
+        self.logger.info(f">>>>>>>>>>>>>>>> Serving at {self.host}:{self.port}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def build_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != "/predict":
+                    self.send_error(404)
+                    return
+                return_prob = parse_qs(url.query).get("prob", ["0"])[0] == "1"
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    if self.headers.get("Content-Type", "") == "application/json":
+                        data_dict = server.load(json.loads(body)["path"])
+                    else:
+                        data_dict = dict(np.load(io.BytesIO(body)))
+                    start = time.time()
+                    result = server.predict(data_dict, return_prob=return_prob)
+                except Exception as e:
+                    self.send_error(500, explain=repr(e))
+                    return
+                server.logger.info(
+                    f"Served {len(result['pred'])} points in {time.time() - start:.3f}s"
+                )
+                buffer = io.BytesIO()
+                np.savez(buffer, **result)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(buffer.tell()))
+                self.end_headers()
+                self.wfile.write(buffer.getvalue())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
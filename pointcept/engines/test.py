@@ -10,18 +10,24 @@ from uuid import uuid4
 import os
 import time
 import numpy as np
-from collections import OrderedDict
 import torch
 import torch.distributed as dist
 import torch.nn.functional as F
 import torch.utils.data
 
-from .defaults import create_ddp_model
+from .defaults import create_ddp_model, compile_model
 import pointcept.utils.comm as comm
 from pointcept.datasets import build_dataset, collate_fn
 from pointcept.models import build_model
+from pointcept.models.utils import (
+    optimize_for_inference,
+    quantize_dynamic,
+    NeighbourCache,
+)
 from pointcept.utils.logger import get_root_logger
 from pointcept.utils.registry import Registry
+from pointcept.utils.checkpoint import load_checkpoint, remap_state_dict
+from pointcept.utils.memory import fit_memory_model, subsample_points
 from pointcept.utils.misc import (
     AverageMeter,
     intersection_and_union,
@@ -38,8 +44,59 @@ except:
 TESTERS = Registry("testers")
 
 
+class FragmentFill:
+    """
+    Points left out by GridSample(max_parts / coverage) in test mode take the
+    prediction a covered point of the same voxel received from the same variant.
+    Each group (variant) of fill_index / fill_source comes with the range of
+    fragments it contributes (see DefaultDataset.prepare_test_data), call after
+    every accumulated fragment with the number of fragments accumulated so far.
+    """
+
+    def __init__(self, data_dict, device):
+        self.groups = []
+        if "fill_index" not in data_dict.keys():
+            return
+        fill_index = torch.from_numpy(np.asarray(data_dict["fill_index"]))
+        fill_source = torch.from_numpy(np.asarray(data_dict["fill_source"]))
+        start = 0
+        for end, (s_i, e_i) in zip(
+            data_dict["fill_offset"], data_dict["fill_fragment"]
+        ):
+            if e_i > s_i and end > start:
+                self.groups.append(
+                    dict(
+                        start=int(s_i),
+                        end=int(e_i),
+                        index=fill_index[start:end].long().to(device),
+                        source=fill_source[start:end].long().to(device),
+                    )
+                )
+            start = end
+        self.before = {}
+
+    def __call__(self, pred, num_fragments):
+        for i, group in enumerate(self.groups):
+            if group["end"] == num_fragments:
+                # contribution of the group's own fragments to the source points
+                contribution = pred[group["source"]] - self.before.pop(i)
+                pred.index_add_(0, group["index"], contribution)
+        for i, group in enumerate(self.groups):
+            if group["start"] == num_fragments:
+                self.before[i] = pred[group["source"]].clone()
+        return pred
+
+
 class TesterBase:
-    def __init__(self, cfg, model=None, test_loader=None, verbose=False) -> None:
+    def __init__(
+        self,
+        cfg,
+        model=None,
+        test_loader=None,
+        verbose=False,
+        optimize=False,
+        quantize=False,
+    ) -> None:
         torch.multiprocessing.set_sharing_strategy("file_system")
         self.logger = get_root_logger(
             log_file=os.path.join(cfg.save_path, "test.log"),
@@ -48,6 +105,11 @@ class TesterBase:
         self.logger.info("=> Loading config ...")
         self.cfg = cfg
         self.verbose = verbose
+        # rewrite model for inference only usage, see optimize_for_inference
+        self.optimize = optimize
+        # dynamic int8 quantization of nn.Linear, run inference on cpu
+        self.quantize = quantize
+        self.device = torch.device("cpu") if quantize else comm.get_device()
         if self.verbose and model is None:
             # if model is not none, trigger tester with trainer, no need to print config
             self.logger.info(f"Save path: {cfg.save_path}")
@@ -63,35 +125,40 @@ class TesterBase:
         else:
             self.test_loader = test_loader
 
-    def build_model(self):
+    def build_model(self, weight_path=None):
+        weight_path = weight_path if weight_path is not None else self.cfg.weight
         model = build_model(self.cfg.model)
         n_parameters = sum(p.numel() for p in model.parameters() if p.requires_grad)
         self.logger.info(f"Num params: {n_parameters}")
-        model = create_ddp_model(
-            model.cuda(),
-            broadcast_buffers=False,
-            find_unused_parameters=self.cfg.find_unused_parameters,
-        )
-        if os.path.isfile(self.cfg.weight):
-            self.logger.info(f"Loading weight at: {self.cfg.weight}")
-            checkpoint = torch.load(self.cfg.weight, weights_only=False)
-            weight = OrderedDict()
-            for key, value in checkpoint["state_dict"].items():
-                if key.startswith("module."):
-                    if comm.get_world_size() == 1:
-                        key = key[7:]  # module.xxx.xxx -> xxx.xxx
-                else:
-                    if comm.get_world_size() > 1:
-                        key = "module." + key  # xxx.xxx -> module.xxx.xxx
-                weight[key] = value
+        if os.path.isfile(weight_path):
+            self.logger.info(f"Loading weight at: {weight_path}")
+            checkpoint = load_checkpoint(weight_path)
+            weight = remap_state_dict(checkpoint["state_dict"])
             model.load_state_dict(weight, strict=True)
             self.logger.info(
                 "=> Loaded weight '{}' (epoch {})".format(
-                    self.cfg.weight, checkpoint["epoch"]
+                    weight_path, checkpoint["epoch"]
                 )
             )
         else:
-            raise RuntimeError("=> No checkpoint found at '{}'".format(self.cfg.weight))
+            raise RuntimeError("=> No checkpoint found at '{}'".format(weight_path))
+        if self.optimize:
+            self.logger.info("=> Optimizing model for inference ...")
+            model = optimize_for_inference(model)
+        if self.quantize:
+            self.logger.info("=> Quantizing model with dynamic int8 ...")
+            model = quantize_dynamic(model)
+        if self.cfg.compile:
+            self.logger.info(f"=> Compiling model with: {self.cfg.compile}")
+            model = compile_model(model, **self.cfg.compile)
+        if self.quantize:
+            # quantized model is inference only, no need to wrap with ddp
+            return model
+        model = create_ddp_model(
+            model.to(self.device),
+            broadcast_buffers=False,
+            find_unused_parameters=self.cfg.find_unused_parameters,
+        )
         return model
 
     def build_test_loader(self):
@@ -121,6 +188,85 @@ class TesterBase:
 
 @TESTERS.register_module()
 class SemSegTester(TesterBase):
+    def __init__(
+        self,
+        reuse_neighbours=False,
+        memory_budget=None,
+        profile_points=100000,
+        **kwargs,
+    ):
+        # reuse kNN / pooling / serialization across consecutive fragments holding the
+        # same points, i.e. test-time augmentation variants with test_cfg.share_partition
+        self.reuse_neighbours = reuse_neighbours
+        # device memory (GiB) of inference, crops and fragment batches are sized to
+        # fill it according to the profiled peak memory of the model
+        self.memory_budget = memory_budget
+        # largest number of points profiled, the fit extrapolates beyond it
+        self.profile_points = profile_points
+        self.max_points = None
+        if memory_budget is not None:
+            assert (
+                not kwargs.get("quantize", False) and comm.get_device().type == "cuda"
+            ), "memory_budget profiles cuda memory, run the tester on a cuda device."
+        super().__init__(**kwargs)
+
+    def build_test_loader(self):
+        if self.memory_budget is not None:
+            self.max_points = self.estimate_max_points()
+            if self.cfg.data.test.test_cfg.crop:
+                self.logger.warning(
+                    f"=> memory_budget overrides test_cfg.crop "
+                    f"{self.cfg.data.test.test_cfg.crop}"
+                )
+            self.cfg.data.test.test_cfg.crop = dict(
+                type="SphereCrop", point_max=self.max_points, mode="all"
+            )
+        return super().build_test_loader()
+
+    def estimate_max_points(self):
+        # profile the model on subsets (at most profile_points) of the first
+        # fragment of the test set, large scenes are never run uncropped
+        fragment = build_dataset(self.cfg.data.test)[0]["fragment_list"][0]
+        input_dict = collate_fn([fragment])
+        num_points = min(input_dict["coord"].shape[0], self.profile_points)
+        input_dict = subsample_points(input_dict, num_points)
+        for key in input_dict.keys():
+            if isinstance(input_dict[key], torch.Tensor):
+                input_dict[key] = input_dict[key].to(self.device)
+        self.model.eval()
+        memory_model = fit_memory_model(
+            self.model,
+            input_dict,
+            [num_points * (i + 1) // 4 for i in range(4)],
+            device=self.device,
+        )
+        resident = torch.cuda.memory_allocated(self.device)
+        budget = self.memory_budget * 1024**3 - resident
+        max_points = memory_model.max_points(budget)
+        self.logger.info(
+            f"=> Peak memory {memory_model}, "
+            f"{max_points} points per forward with {self.memory_budget} GiB"
+        )
+        assert max_points > 0, (
+            f"memory_budget {self.memory_budget} GiB is too small: "
+            f"{resident / 1024**3:.2f} GiB resident (weights) and "
+            f"{memory_model(0) / 1024**3:.2f} GiB fixed peak memory per forward."
+        )
+        return max_points
+
+    def fragment_batches(self, fragment_list):
+        # consecutive fragments are packed up to max_points (memory_budget) per forward
+        if self.max_points is None or self.reuse_neighbours:
+            return [(i, i + 1) for i in range(len(fragment_list))]
+        batches, start, num_points = [], 0, 0
+        for i, fragment in enumerate(fragment_list):
+            if i > start and num_points + len(fragment["coord"]) > self.max_points:
+                batches.append((start, i))
+                start, num_points = i, 0
+            num_points += len(fragment["coord"])
+        batches.append((start, len(fragment_list)))
+        return batches
+
     def test(self):
         assert self.test_loader.batch_size == 1
         logger = get_root_logger()
@@ -173,7 +319,7 @@ class SemSegTester(TesterBase):
             segment = data_dict.pop("segment")
             data_name = data_dict.pop("name")
             pred_save_path = os.path.join(save_path, "{}_pred.npy".format(data_name))
-            print("saving to : "+str(pred_save_path))
+            print("saving to : " + str(pred_save_path))
             if os.path.isfile(pred_save_path):
                 logger.info(
                     "{}/{}: {}, loaded pred and label.".format(
@@ -184,25 +330,38 @@ class SemSegTester(TesterBase):
                 if "origin_segment" in data_dict.keys():
                     segment = data_dict["origin_segment"]
             else:
-                pred = torch.zeros((segment.size, self.cfg.data.num_classes)).cuda()
-                for i in range(len(fragment_list)):
-                    fragment_batch_size = 1
-                    s_i, e_i = i * fragment_batch_size, min(
-                        (i + 1) * fragment_batch_size, len(fragment_list)
-                    )
+                pred = torch.zeros((segment.size, self.cfg.data.num_classes)).to(
+                    self.device
+                )
+                cache = NeighbourCache()
+                fill = FragmentFill(data_dict, self.device)
+                pred = fill(pred, 0)
+                fragment_batches = self.fragment_batches(fragment_list)
+                for i, (s_i, e_i) in enumerate(fragment_batches):
                     input_dict = collate_fn(fragment_list[s_i:e_i])
+                    if self.reuse_neighbours:
+                        if cache.key is None or not torch.equal(
+                            cache.key, input_dict["index"]
+                        ):
+                            cache = NeighbourCache(key=input_dict["index"])
+                        cache.rewind()
                     for key in input_dict.keys():
                         if isinstance(input_dict[key], torch.Tensor):
-                            input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                            input_dict[key] = input_dict[key].to(
+                                self.device, non_blocking=True
+                            )
                     idx_part = input_dict["index"]
+                    if self.reuse_neighbours:
+                        input_dict["neighbour_cache"] = cache
                     with torch.no_grad():
                         pred_part = self.model(input_dict)["seg_logits"]  # (n, k)
                         pred_part = F.softmax(pred_part, -1)
                         if self.cfg.empty_cache:
                             torch.cuda.empty_cache()
                         bs = 0
-                        for be in input_dict["offset"]:
+                        for j, be in enumerate(input_dict["offset"]):
                             pred[idx_part[bs:be], :] += pred_part[bs:be]
+                            pred = fill(pred, s_i + j + 1)
                             bs = be
 
                     logger.info(
@@ -211,7 +370,7 @@ class SemSegTester(TesterBase):
                             len(self.test_loader),
                             data_name=data_name,
                             batch_idx=i,
-                            batch_num=len(fragment_list),
+                            batch_num=len(fragment_batches),
                         )
                     )
                 if self.cfg.data.test.type == "ScanNetPPDataset":
@@ -256,7 +415,11 @@ class SemSegTester(TesterBase):
                 )
                 submit = pred.astype(np.uint32)
                 print("Histogram of prediction")
-                print(np.histogram(submit, bins=10, range=None, density=None, weights=None))
+                print(
+                    np.histogram(
+                        submit, bins=10, range=None, density=None, weights=None
+                    )
+                )
                 submit = np.vectorize(
                     self.test_loader.dataset.learning_map_inv.__getitem__
                 )(submit).astype(np.uint32)
@@ -366,6 +529,143 @@ class SemSegTester(TesterBase):
         return batch
 
 
+@TESTERS.register_module()
+class MultiCkptSemSegTester(TesterBase):
+    """
+    Evaluate several checkpoints in one data pass. Each prepared fragment is fed
+    through all models, metrics are reported per checkpoint and for the ensemble
+    averaging softmax probabilities of all checkpoints. self.model is a list here.
+    """
+
+    def __init__(self, weights=None, ensemble=True, **kwargs):
+        # weights: list of checkpoint paths, default [cfg.weight]
+        self.weights = weights
+        self.ensemble = ensemble
+        super().__init__(**kwargs)
+        if not isinstance(self.model, list):
+            # model given by trainer
+            self.model = [self.model]
+        self.weights = self.weights or [self.cfg.weight]
+        self.names = []
+        for i, weight in enumerate(self.weights):
+            name = os.path.splitext(os.path.basename(weight))[0]
+            self.names.append(name if name not in self.names else f"{name}_{i}")
+        if self.ensemble and len(self.weights) > 1:
+            self.names.append("ensemble")
+
+    def build_model(self):
+        if not self.weights:
+            self.weights = [self.cfg.weight]
+        return [super().build_model(weight) for weight in self.weights]
+
+    def test(self):
+        assert self.test_loader.batch_size == 1
+        logger = get_root_logger()
+        logger.info(">>>>>>>>>>>>>>>> Start Evaluation >>>>>>>>>>>>>>>>")
+        for model in self.model:
+            model.eval()
+        batch_time = AverageMeter()
+        record = {name: {} for name in self.names}
+        for idx, data_dict in enumerate(self.test_loader):
+            start = time.time()
+            data_dict = data_dict[0]  # current assume batch size is 1
+            fragment_list = data_dict.pop("fragment_list")
+            segment = data_dict.pop("segment")
+            data_name = data_dict.pop("name")
+            preds = [
+                torch.zeros((segment.size, self.cfg.data.num_classes)).to(self.device)
+                for _ in self.model
+            ]
+            fills = [FragmentFill(data_dict, self.device) for _ in self.model]
+            preds = [fill(pred, 0) for pred, fill in zip(preds, fills)]
+            for i in range(len(fragment_list)):
+                input_dict = collate_fn(fragment_list[i : i + 1])
+                for key in input_dict.keys():
+                    if isinstance(input_dict[key], torch.Tensor):
+                        input_dict[key] = input_dict[key].to(
+                            self.device, non_blocking=True
+                        )
+                idx_part = input_dict["index"]
+                with torch.no_grad():
+                    for pred, model, fill in zip(preds, self.model, fills):
+                        # shallow copy as model may add keys to input
+                        pred_part = model(dict(input_dict))["seg_logits"]
+                        pred[idx_part] += F.softmax(pred_part, -1)
+                        fill(pred, i + 1)
+                if self.cfg.empty_cache:
+                    torch.cuda.empty_cache()
+            if self.ensemble and len(preds) > 1:
+                preds.append(sum(preds) / len(preds))
+            if "origin_segment" in data_dict.keys():
+                assert "inverse" in data_dict.keys()
+                segment = data_dict["origin_segment"]
+            info = []
+            for name, pred in zip(self.names, preds):
+                pred = pred.max(1)[1].data.cpu().numpy()
+                if "origin_segment" in data_dict.keys():
+                    pred = pred[data_dict["inverse"]]
+                intersection, union, target = intersection_and_union(
+                    pred, segment, self.cfg.data.num_classes, self.cfg.data.ignore_index
+                )
+                record[name][data_name] = dict(
+                    intersection=intersection, union=union, target=target
+                )
+                mask = union != 0
+                iou = np.mean((intersection / (union + 1e-10))[mask])
+                info.append(f"{name} {iou:.4f}")
+            batch_time.update(time.time() - start)
+            logger.info(
+                "Test: {} [{}/{}]-{} Batch {batch_time.val:.3f} ({batch_time.avg:.3f}) "
+                "mIoU {info}".format(
+                    data_name,
+                    idx + 1,
+                    len(self.test_loader),
+                    segment.size,
+                    batch_time=batch_time,
+                    info=", ".join(info),
+                )
+            )
+
+        logger.info("Syncing ...")
+        comm.synchronize()
+        record_sync = comm.gather(record, dst=0)
+
+        if comm.is_main_process():
+            result = {}
+            for name in self.names:
+                meters = {}
+                for r in record_sync:
+                    meters.update(r[name])
+                intersection = np.sum([m["intersection"] for m in meters.values()], 0)
+                union = np.sum([m["union"] for m in meters.values()], 0)
+                target = np.sum([m["target"] for m in meters.values()], 0)
+                iou_class = intersection / (union + 1e-10)
+                accuracy_class = intersection / (target + 1e-10)
+                result[name] = dict(
+                    mIoU=float(np.mean(iou_class)),
+                    mAcc=float(np.mean(accuracy_class)),
+                    allAcc=float(sum(intersection) / (sum(target) + 1e-10)),
+                    iou_class=iou_class.tolist(),
+                )
+                logger.info(
+                    "Val result ({}): mIoU/mAcc/allAcc {:.4f}/{:.4f}/{:.4f}".format(
+                        name,
+                        result[name]["mIoU"],
+                        result[name]["mAcc"],
+                        result[name]["allAcc"],
+                    )
+                )
+            with open(
+                os.path.join(self.cfg.save_path, "multi_ckpt_result.json"), "w"
+            ) as f:
+                json.dump(result, f, indent=4)
+            logger.info("<<<<<<<<<<<<<<<<< End Evaluation <<<<<<<<<<<<<<<<<")
+
+    @staticmethod
+    def collate_fn(batch):
+        return batch
+
+
 @TESTERS.register_module()
 class DINOSemSegTester(TesterBase):
     def test(self):
@@ -419,12 +719,18 @@ class DINOSemSegTester(TesterBase):
             fragment_list = data_dict.pop("fragment_list")
             segment = data_dict.pop("segment")
             data_name = data_dict.pop("name")
-            dino_coord = data_dict.pop("dino_coord").cuda(non_blocking=True)
-            dino_feat = data_dict.pop("dino_feat").cuda(non_blocking=True)
-            dino_offset = data_dict.pop("dino_offset").cuda(non_blocking=True)
+            dino_coord = data_dict.pop("dino_coord").to(self.device, non_blocking=True)
+            dino_feat = data_dict.pop("dino_feat").to(self.device, non_blocking=True)
+            dino_offset = data_dict.pop("dino_offset").to(
+                self.device, non_blocking=True
+            )
             pred_save_path = os.path.join(save_path, "{}_pred.npy".format(data_name))
 
-            print("test.py is calculating accuracy based on : "+str(pred_save_path) + ' and :data_dict["origin_segment"] ')
+            print(
+                "test.py is calculating accuracy based on : "
+                + str(pred_save_path)
+                + ' and :data_dict["origin_segment"] '
+            )
 
             if os.path.isfile(pred_save_path):
                 logger.info(
@@ -436,7 +742,11 @@ class DINOSemSegTester(TesterBase):
                 if "origin_segment" in data_dict.keys():
                     segment = data_dict["origin_segment"]
             else:
-                pred = torch.zeros((segment.size, self.cfg.data.num_classes)).cuda()
+                pred = torch.zeros((segment.size, self.cfg.data.num_classes)).to(
+                    self.device
+                )
+                fill = FragmentFill(data_dict, self.device)
+                pred = fill(pred, 0)
                 for i in range(len(fragment_list)):
                     fragment_batch_size = 1
                     s_i, e_i = i * fragment_batch_size, min(
@@ -445,7 +755,9 @@ class DINOSemSegTester(TesterBase):
                     input_dict = collate_fn(fragment_list[s_i:e_i])
                     for key in input_dict.keys():
                         if isinstance(input_dict[key], torch.Tensor):
-                            input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                            input_dict[key] = input_dict[key].to(
+                                self.device, non_blocking=True
+                            )
                     input_dict["dino_coord"] = dino_coord
                     input_dict["dino_feat"] = dino_feat
                     input_dict["dino_offset"] = dino_offset
@@ -456,8 +768,9 @@ class DINOSemSegTester(TesterBase):
                         if self.cfg.empty_cache:
                             torch.cuda.empty_cache()
                         bs = 0
-                        for be in input_dict["offset"]:
+                        for j, be in enumerate(input_dict["offset"]):
                             pred[idx_part[bs:be], :] += pred_part[bs:be]
+                            pred = fill(pred, s_i + j + 1)
                             bs = be
 
                     logger.info(
@@ -633,7 +946,7 @@ class ClsTester(TesterBase):
         for i, input_dict in enumerate(self.test_loader):
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(self.device, non_blocking=True)
             end = time.time()
             with torch.no_grad():
                 output_dict = self.model(input_dict)
@@ -752,7 +1065,7 @@ class ClsVotingTester(TesterBase):
             input_dict = collate_fn(voting_list)
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
-                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                    input_dict[key] = input_dict[key].to(self.device, non_blocking=True)
             with torch.no_grad():
                 pred = F.softmax(self.model(input_dict)["cls_logits"], -1).sum(
                     0, keepdim=True
@@ -837,7 +1150,7 @@ class PartSegTester(TesterBase):
             data_name = test_dataset.get_data_name(idx)
 
             data_dict_list, label = test_dataset[idx]
-            pred = torch.zeros((label.size, self.cfg.data.num_classes)).cuda()
+            pred = torch.zeros((label.size, self.cfg.data.num_classes)).to(self.device)
             batch_num = int(np.ceil(len(data_dict_list) / self.cfg.batch_size_test))
             for i in range(batch_num):
                 s_i, e_i = i * self.cfg.batch_size_test, min(
@@ -846,7 +1159,9 @@ class PartSegTester(TesterBase):
                 input_dict = collate_fn(data_dict_list[s_i:e_i])
                 for key in input_dict.keys():
                     if isinstance(input_dict[key], torch.Tensor):
-                        input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                        input_dict[key] = input_dict[key].to(
+                            self.device, non_blocking=True
+                        )
                 with torch.no_grad():
                     pred_part = self.model(input_dict)["cls_logits"]
                     pred_part = F.softmax(pred_part, -1)
@@ -945,7 +1260,7 @@ class InsSegTester(TesterBase):
             data_name = data_dict.pop("name")
             for key in data_dict.keys():
                 if isinstance(data_dict[key], torch.Tensor):
-                    data_dict[key] = data_dict[key].cuda(non_blocking=True)
+                    data_dict[key] = data_dict[key].to(self.device, non_blocking=True)
             with torch.no_grad():
                 output_dict = self.model(data_dict)
                 segment = data_dict["origin_segment"]
@@ -1253,7 +1568,7 @@ class InsSegTester(TesterBase):
                         y_true_sorted_cumsum = np.cumsum(y_true_sorted)
 
                         # unique thresholds
-                        (thresholds, unique_indices) = np.unique(
+                        thresholds, unique_indices = np.unique(
                             y_score_sorted, return_index=True
                         )
                         num_prec_recall = len(unique_indices) + 1
@@ -22,10 +22,15 @@ else:
     from collections import Iterator
 from tensorboardX import SummaryWriter
 
-from .defaults import create_ddp_model, worker_init_fn
+from .defaults import create_ddp_model, compile_model, worker_init_fn
 from .hooks import HookBase, build_hooks
 import pointcept.utils.comm as comm
-from pointcept.datasets import build_dataset, point_collate_fn, collate_fn
+from pointcept.datasets import (
+    build_dataset,
+    point_collate_fn,
+    collate_fn,
+    BatchCompose,
+)
 from pointcept.models import build_model
 from pointcept.utils.logger import get_root_logger
 from pointcept.utils.optimizer import build_optimizer
@@ -143,6 +148,7 @@ class Trainer(TrainerBase):
         self.writer = self.build_writer()
         self.logger.info("=> Building train dataset & dataloader ...")
         self.train_loader = self.build_train_loader()
+        self.batch_transform = self.build_batch_transform()
         self.logger.info("=> Building val dataset & dataloader ...")
         self.val_loader = self.build_val_loader()
         self.logger.info("=> Building optimize, scheduler, scaler(amp) ...")
@@ -182,7 +188,7 @@ class Trainer(TrainerBase):
 
     def run_step(self):
         if version.parse(torch.__version__) >= version.parse("2.4"):
-            auto_cast = partial(torch.amp.autocast, device_type="cuda")
+            auto_cast = partial(torch.amp.autocast, device_type=comm.get_device().type)
         else:
             # deprecated warning
             auto_cast = torch.cuda.amp.autocast
@@ -190,7 +196,11 @@ class Trainer(TrainerBase):
         input_dict = self.comm_info["input_dict"]
         for key in input_dict.keys():
             if isinstance(input_dict[key], torch.Tensor):
-                input_dict[key] = input_dict[key].cuda(non_blocking=True)
+                input_dict[key] = input_dict[key].to(
+                    comm.get_device(), non_blocking=True
+                )
+        if self.batch_transform is not None:
+            input_dict = self.batch_transform(input_dict)
 
         with auto_cast(
             enabled=self.cfg.enable_amp, dtype=AMP_DTYPE[self.cfg.amp_dtype]
@@ -239,8 +249,11 @@ class Trainer(TrainerBase):
         n_parameters = sum(p.numel() for p in model.parameters() if p.requires_grad)
         # logger.info(f"Model: \n{self.model}")
         self.logger.info(f"Num params: {n_parameters}")
+        if self.cfg.compile:
+            self.logger.info(f"=> Compiling model with: {self.cfg.compile}")
+            model = compile_model(model, **self.cfg.compile)
         model = create_ddp_model(
-            model.cuda(),
+            model.to(comm.get_device()),
             broadcast_buffers=False,
             find_unused_parameters=self.cfg.find_unused_parameters,
         )
@@ -294,6 +307,12 @@ class Trainer(TrainerBase):
         )
         return train_loader
 
+    def build_batch_transform(self):
+        # optional augmentation on the collated batch, applied on device in run_step
+        if not self.cfg.batch_transform:
+            return None
+        return BatchCompose(self.cfg.batch_transform)
+
     def build_val_loader(self):
         val_loader = None
         if self.cfg.evaluate:
@@ -324,7 +343,7 @@ class Trainer(TrainerBase):
 
     def build_scaler(self):
         if version.parse(torch.__version__) >= version.parse("2.4"):
-            grad_scaler = partial(torch.amp.GradScaler, device="cuda")
+            grad_scaler = partial(torch.amp.GradScaler, device=comm.get_device().type)
         else:
             # deprecated warning
             grad_scaler = torch.cuda.amp.GradScaler
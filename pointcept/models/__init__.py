@@ -1,27 +1,134 @@
-from .builder import build_model
+from .builder import build_model, MODELS
 from .default import DefaultSegmentor, DefaultClassifier
 from .modules import PointModule, PointModel
 
-# Backbones
-from .sparse_unet import *
-from .point_transformer import *
-from .point_transformer_v2 import *
-from .point_transformer_v3 import *
-from .stratified_transformer import *
-from .spvcnn import *
-from .octformer import *
-from .oacnns import *
+# Models are registered lazily: a package is only imported (together with its
+# optional dependencies, e.g. spconv, flash_attn, ocnn) when its type is built.
 
-# from .swin3d import *
+# Backbones
+MODELS.register_lazy_module(
+    "pointcept.models.sparse_unet.mink_unet",
+    [
+        "MinkUNet14",
+        "MinkUNet18",
+        "MinkUNet34",
+        "MinkUNet50",
+        "MinkUNet101",
+        "MinkUNet14A",
+        "MinkUNet14B",
+        "MinkUNet14C",
+        "MinkUNet14D",
+        "MinkUNet18A",
+        "MinkUNet18B",
+        "MinkUNet18D",
+        "MinkUNet34A",
+        "MinkUNet34B",
+        "MinkUNet34C",
+    ],
+)
+MODELS.register_lazy_module(
+    "pointcept.models.sparse_unet.spconv_unet_v1m1_base",
+    ["SpUNet-v1m1", "SpUNetNoSkipBase"],
+)
+MODELS.register_lazy_module(
+    "pointcept.models.sparse_unet.spconv_unet_v1m2_bn_momentum", "SpUNet-v1m2"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.sparse_unet.spconv_unet_v1m3_pdnorm", "SpUNet-v1m3"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer.point_transformer_seg",
+    [
+        "PointTransformer-Seg26",
+        "PointTransformer-Seg38",
+        "PointTransformer-Seg50",
+    ],
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer.point_transformer_partseg",
+    [
+        "PointTransformer-PartSeg26",
+        "PointTransformer-PartSeg38",
+        "PointTransformer-PartSeg50",
+    ],
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer.point_transformer_cls",
+    [
+        "PointTransformer-Cls26",
+        "PointTransformer-Cls38",
+        "PointTransformer-Cls50",
+    ],
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer_v2.point_transformer_v2m1_origin", "PT-v2m1"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer_v2.point_transformer_v2m2_base", "PT-v2m2"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer_v2.point_transformer_v2m3_pdnorm", "PT-v2m3"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer_v3.point_transformer_v3m1_base", "PT-v3m1"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_transformer_v3.point_transformer_v3m2_sonata", "PT-v3m2"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.stratified_transformer.stratified_transformer_v1m1_origin",
+    "ST-v1m1",
+)
+MODELS.register_lazy_module(
+    "pointcept.models.stratified_transformer.stratified_transformer_v1m2_refine",
+    "ST-v1m2",
+)
+MODELS.register_lazy_module("pointcept.models.spvcnn.ts_spvcnn", "SPVCNN")
+MODELS.register_lazy_module(
+    "pointcept.models.octformer.octformer_v1m1_base", "OctFormer-v1m1"
+)
+MODELS.register_lazy_module("pointcept.models.oacnns.oacnns_v1m1_base", "OACNNs")
+MODELS.register_lazy_module("pointcept.models.swin3d.swin3d_v1m1_base", "Swin3D-v1m1")
 
 # Semantic Segmentation
-from .context_aware_classifier import *
+MODELS.register_lazy_module(
+    "pointcept.models.context_aware_classifier.context_aware_classifier_v1m1_base",
+    "CAC-v1m1",
+)
 
 # Instance Segmentation
-from .point_group import *
-from .sgiformer import *
+MODELS.register_lazy_module(
+    "pointcept.models.point_group.point_group_v1m1_base", "PG-v1m1"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_group.point_group_v1m2_custom_criteria", "PG-v1m2"
+)
+MODELS.register_lazy_module(
+    "pointcept.models.sgiformer.sgiformer_v1m1_base", "SGIFormer-v1m1"
+)
 
 # Pretraining
-from .masked_scene_contrast import *
-from .point_prompt_training import *
-from .sonata import *
+MODELS.register_lazy_module(
+    "pointcept.models.masked_scene_contrast.masked_scene_contrast_v1m1_base",
+    "MSC-v1m1",
+)
+MODELS.register_lazy_module(
+    "pointcept.models.masked_scene_contrast.masked_scene_contrast_v1m2_csc",
+    "MSC-v1m2",
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_prompt_training.point_prompt_training_v1m1_language_guided",
+    "PPT-v1m1",
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_prompt_training.point_prompt_training_v1m2_decoupled",
+    "PPT-v1m2",
+)
+MODELS.register_lazy_module(
+    "pointcept.models.point_prompt_training.point_prompt_training_v1m3_neo",
+    "PPT-v1m3",
+)
+MODELS.register_lazy_module("pointcept.models.sonata.sonata_v1m1_base", "Sonata-v1m1")
+MODELS.register_lazy_module(
+    "pointcept.models.sonata.sonata_v1m2_uni_teacher_head", "Sonata-v1m2"
+)
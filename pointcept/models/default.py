@@ -27,7 +27,7 @@ class DefaultSegmentor(nn.Module):
             loss = self.criteria(seg_logits, input_dict["segment"])
             return dict(loss=loss)
         # eval
-        elif "segment" in input_dict.keys():
+        elif "segment" in input_dict.keys() and self.criteria is not None:
             loss = self.criteria(seg_logits, input_dict["segment"])
             return dict(loss=loss, seg_logits=seg_logits)
         # test
@@ -83,7 +83,7 @@ class DefaultSegmentorV2(nn.Module):
             loss = self.criteria(seg_logits, input_dict["segment"])
             return_dict["loss"] = loss
         # eval
-        elif "segment" in input_dict.keys():
+        elif "segment" in input_dict.keys() and self.criteria is not None:
             loss = self.criteria(seg_logits, input_dict["segment"])
             return_dict["loss"] = loss
             return_dict["seg_logits"] = seg_logits
@@ -166,7 +166,7 @@ class DINOEnhancedSegmentor(nn.Module):
             loss = self.criteria(seg_logits, input_dict["segment"])
             return_dict["loss"] = loss
         # eval
-        elif "segment" in input_dict.keys():
+        elif "segment" in input_dict.keys() and self.criteria is not None:
             loss = self.criteria(seg_logits, input_dict["segment"])
             return_dict["loss"] = loss
             return_dict["seg_logits"] = seg_logits
@@ -221,7 +221,7 @@ class DefaultClassifier(nn.Module):
         if self.training:
             loss = self.criteria(cls_logits, input_dict["category"])
             return dict(loss=loss)
-        elif "category" in input_dict.keys():
+        elif "category" in input_dict.keys() and self.criteria is not None:
             loss = self.criteria(cls_logits, input_dict["category"])
             return dict(loss=loss, cls_logits=cls_logits)
         else:
@@ -104,17 +104,10 @@ class MaskedSceneContrast(nn.Module):
         mask_patch_cluster = voxel_grid(
             pos=mask_patch_grid_coord, size=1, batch=union_batch, start=0
         )
-        unique, cluster, counts = torch.unique(
-            mask_patch_cluster, sorted=True, return_inverse=True, return_counts=True
+        unique, cluster = torch.unique(
+            mask_patch_cluster, sorted=True, return_inverse=True
         )
         patch_num = unique.shape[0]
-        patch_max_point = counts.max().item()
-        patch2point_map = cluster.new_zeros(patch_num, patch_max_point)
-        patch2point_mask = torch.lt(
-            torch.arange(patch_max_point).cuda().unsqueeze(0), counts.unsqueeze(-1)
-        )
-        sorted_cluster_value, sorted_cluster_indices = torch.sort(cluster)
-        patch2point_map[patch2point_mask] = sorted_cluster_indices
 
         # generate cross masks
         assert self.mask_rate <= 0.5
@@ -125,15 +118,8 @@ class MaskedSceneContrast(nn.Module):
         # mask1 tag with 1, mask2 tag with 2
         patch_mask[rand_perm[0:mask_patch_num]] = 1
         patch_mask[rand_perm[mask_patch_num : mask_patch_num * 2]] = 2
-        point_mask = torch.zeros(
-            union_origin_coord.shape[0], device=union_origin_coord.device
-        ).int()
-        point_mask[
-            patch2point_map[patch_mask == 1][patch2point_mask[patch_mask == 1]]
-        ] = 1
-        point_mask[
-            patch2point_map[patch_mask == 2][patch2point_mask[patch_mask == 2]]
-        ] = 2
+        # each point takes the tag of its patch (cluster is the point to patch map)
+        point_mask = patch_mask[cluster]
 
         # separate mask to view1 and view2
         point_mask_split = point_mask.split(
@@ -20,7 +20,7 @@ from timm.layers import DropPath
 import pointops
 
 from pointcept.models.builder import MODELS
-from pointcept.models.utils import offset2batch, batch2offset
+from pointcept.models.utils import offset2batch, batch2offset, cached
 
 
 class PointBatchNorm(nn.Module):
@@ -46,6 +46,9 @@ class PointBatchNorm(nn.Module):
 
 
 class GroupedVectorAttention(nn.Module):
+    # inference only: attend chunk_size query points at a time, see forward
+    chunk_size = None
+
     def __init__(
         self,
         embed_channels,
@@ -106,9 +109,32 @@ class GroupedVectorAttention(nn.Module):
             self.linear_k(feat),
             self.linear_v(feat),
         )
+        if self.chunk_size is not None and not self.training:
+            return self.chunked_forward(query, key, value, coord, reference_index)
         key = pointops.grouping(reference_index, key, coord, with_xyz=True)
         value = pointops.grouping(reference_index, value, coord, with_xyz=False)
         pos, key = key[:, :, 0:3], key[:, :, 3:]
+        return self.attention(query, key, value, pos, reference_index)
+
+    def chunked_forward(self, query, key, value, coord, reference_index):
+        # group keys / values (n, k, c) of a slice of query points at a time instead of
+        # all points at once, same computation as pointops.grouping in forward
+        key = torch.cat([key, key.new_zeros(1, key.shape[1])], dim=0)
+        value = torch.cat([value, value.new_zeros(1, value.shape[1])], dim=0)
+        padded_coord = torch.cat([coord, coord.new_zeros(1, 3)], dim=0)
+        feat = query.new_empty(query.shape)
+        for start in range(0, query.shape[0], self.chunk_size):
+            end = min(start + self.chunk_size, query.shape[0])
+            index = reference_index[start:end]
+            mask = torch.sign(index + 1)
+            pos = padded_coord[index.long()] - coord[start:end].unsqueeze(1)
+            pos = torch.einsum("n s c, n s -> n s c", pos, mask)
+            feat[start:end] = self.attention(
+                query[start:end], key[index.long()], value[index.long()], pos, index
+            )
+        return feat
+
+    def attention(self, query, key, value, pos, reference_index):
         relation_qk = key - query.unsqueeze(1)
         if self.pe_multiplier:
             pem = self.linear_p_multiplier(pos)
@@ -130,6 +156,9 @@ class GroupedVectorAttention(nn.Module):
 
 
 class Block(nn.Module):
+    # (linear, norm) pairs foldable for inference, see optimize_for_inference
+    fold_pairs = (("fc1", "norm1"), ("fc3", "norm3"))
+
     def __init__(
         self,
         embed_channels,
@@ -216,11 +245,13 @@ class BlockSequence(nn.Module):
             )
             self.blocks.append(block)
 
-    def forward(self, points):
+    def forward(self, points, cache=None):
         coord, feat, offset = points
         # reference index query of neighbourhood attention
         # for windows attention, modify reference index query method
-        reference_index, _ = pointops.knn_query(self.neighbours, coord, offset)
+        reference_index = cached(
+            cache, lambda: pointops.knn_query(self.neighbours, coord, offset)[0]
+        )
         for block in self.blocks:
             points = block(points, reference_index)
         return points
@@ -231,6 +262,8 @@ class GridPool(nn.Module):
     Partition-based Pooling (Grid Pooling)
     """
 
+    fold_pairs = (("fc", "norm"),)
+
     def __init__(self, in_channels, out_channels, grid_size, bias=False):
         super(GridPool, self).__init__()
         self.in_channels = in_channels
@@ -241,10 +274,20 @@ class GridPool(nn.Module):
         self.norm = PointBatchNorm(out_channels)
         self.act = nn.ReLU(inplace=True)
 
-    def forward(self, points, start=None):
+    def forward(self, points, start=None, cache=None):
         coord, feat, offset = points
         batch = offset2batch(offset)
         feat = self.act(self.norm(self.fc(feat)))
+        cluster, sorted_cluster_indices, idx_ptr = cached(
+            cache, lambda: self.partition(coord, batch, start)
+        )
+        coord = segment_csr(coord[sorted_cluster_indices], idx_ptr, reduce="mean")
+        feat = segment_csr(feat[sorted_cluster_indices], idx_ptr, reduce="max")
+        batch = batch[idx_ptr[:-1]]
+        offset = batch2offset(batch)
+        return [coord, feat, offset], cluster
+
+    def partition(self, coord, batch, start=None):
         start = (
             segment_csr(
                 coord,
@@ -262,11 +305,7 @@ class GridPool(nn.Module):
         )
         _, sorted_cluster_indices = torch.sort(cluster)
         idx_ptr = torch.cat([counts.new_zeros(1), torch.cumsum(counts, dim=0)])
-        coord = segment_csr(coord[sorted_cluster_indices], idx_ptr, reduce="mean")
-        feat = segment_csr(feat[sorted_cluster_indices], idx_ptr, reduce="max")
-        batch = batch[idx_ptr[:-1]]
-        offset = batch2offset(batch)
-        return [coord, feat, offset], cluster
+        return cluster, sorted_cluster_indices, idx_ptr
 
 
 class UnpoolWithSkip(nn.Module):
@@ -353,9 +392,9 @@ class Encoder(nn.Module):
             enable_checkpoint=enable_checkpoint,
         )
 
-    def forward(self, points):
-        points, cluster = self.down(points)
-        return self.blocks(points), cluster
+    def forward(self, points, cache=None):
+        points, cluster = self.down(points, cache=cache)
+        return self.blocks(points, cache=cache), cluster
 
 
 class Decoder(nn.Module):
@@ -397,9 +436,9 @@ class Decoder(nn.Module):
             enable_checkpoint=enable_checkpoint,
         )
 
-    def forward(self, points, skip_points, cluster):
+    def forward(self, points, skip_points, cluster, cache=None):
         points = self.up(points, skip_points, cluster)
-        return self.blocks(points)
+        return self.blocks(points, cache=cache)
 
 
 class GVAPatchEmbed(nn.Module):
@@ -438,10 +477,10 @@ class GVAPatchEmbed(nn.Module):
             enable_checkpoint=enable_checkpoint,
         )
 
-    def forward(self, points):
+    def forward(self, points, cache=None):
         coord, feat, offset = points
         feat = self.proj(feat)
-        return self.blocks([coord, feat, offset])
+        return self.blocks([coord, feat, offset], cache=cache)
 
 
 @MODELS.register_module("PT-v2m2")
@@ -470,6 +509,7 @@ class PointTransformerV2(nn.Module):
         drop_path_rate=0,
         enable_checkpoint=False,
         unpool_backend="map",
+        attn_chunk_size=None,
     ):
         super(PointTransformerV2, self).__init__()
         self.in_channels = in_channels
@@ -552,28 +592,34 @@ class PointTransformerV2(nn.Module):
             if num_classes > 0
             else nn.Identity()
         )
+        # low memory inference, see GroupedVectorAttention.chunked_forward
+        for module in self.modules():
+            if isinstance(module, GroupedVectorAttention):
+                module.chunk_size = attn_chunk_size
 
     def forward(self, data_dict):
         coord = data_dict["coord"]
         feat = data_dict["feat"]
         offset = data_dict["offset"].int()
-        print("point_transformer_v2m2_base.py : coord "+str(coord))
-        print("point_transformer_v2m2_base.py : offset "+str(offset))
-        print("nr of points: "+str(coord.shape))
+        # neighbourhoods shared by test-time augmentation variants, see NeighbourCache
+        cache = data_dict.get("neighbour_cache", None)
+        print("point_transformer_v2m2_base.py : coord " + str(coord))
+        print("point_transformer_v2m2_base.py : offset " + str(offset))
+        print("nr of points: " + str(coord.shape))
 
         # a batch of point cloud is a list of coord, feat and offset
         points = [coord, feat, offset]
-        points = self.patch_embed(points)
+        points = self.patch_embed(points, cache=cache)
         skips = [[points]]
         for i in range(self.num_stages):
-            points, cluster = self.enc_stages[i](points)
+            points, cluster = self.enc_stages[i](points, cache=cache)
             skips[-1].append(cluster)  # record grid cluster of pooling
             skips.append([points])  # record points info of current stage
 
         points = skips.pop(-1)[0]  # unpooling points info in the last enc stage
         for i in reversed(range(self.num_stages)):
             skip_points, cluster = skips.pop(-1)
-            points = self.dec_stages[i](points, skip_points, cluster)
+            points = self.dec_stages[i](points, skip_points, cluster, cache=cache)
         coord, feat, offset = points
         seg_logits = self.seg_head(feat)
         return seg_logits
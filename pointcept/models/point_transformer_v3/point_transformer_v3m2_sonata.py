@@ -74,6 +74,7 @@ class SerializedAttention(PointModule):
         order_index=0,
         enable_rpe=False,
         enable_flash=True,
+        enable_sdpa=False,
         upcast_attention=True,
         upcast_softmax=True,
     ):
@@ -86,8 +87,10 @@ class SerializedAttention(PointModule):
         self.upcast_attention = upcast_attention
         self.upcast_softmax = upcast_softmax
         self.enable_rpe = enable_rpe
-        self.enable_flash = enable_flash
-        if enable_flash:
+        # sdpa takes precedence over flash attention when both are enabled
+        self.enable_flash = enable_flash and not enable_sdpa
+        self.enable_sdpa = enable_sdpa
+        if self.enable_flash:
             assert (
                 enable_rpe is False
             ), "Set enable_rpe to False when enable Flash Attention"
@@ -100,6 +103,11 @@ class SerializedAttention(PointModule):
             assert flash_attn is not None, "Make sure flash_attn is installed."
             self.patch_size = patch_size
             self.attn_drop = attn_drop
+        elif enable_sdpa:
+            # keep patch size, patches of samples with fewer points than patch size
+            # are padded and masked, then dispatch to torch scaled_dot_product_attention
+            self.patch_size = patch_size
+            self.attn_drop = attn_drop
         else:
             # when disable flash attention, we still don't want to use mask
             # consequently, patch size will auto set to the
@@ -115,15 +123,41 @@ class SerializedAttention(PointModule):
         self.rpe = RPE(patch_size, num_heads) if self.enable_rpe else None
 
     @torch.no_grad()
-    def get_rel_pos(self, point, order):
+    def get_rel_pos(self, point, order, patch_index=None):
         K = self.patch_size
         rel_pos_key = f"rel_pos_{self.order_index}"
         if rel_pos_key not in point.keys():
             grid_coord = point.grid_coord[order]
-            grid_coord = grid_coord.reshape(-1, K, 3)
+            if patch_index is not None:
+                grid_coord = grid_coord[patch_index]
+            else:
+                grid_coord = grid_coord.reshape(-1, K, 3)
             point[rel_pos_key] = grid_coord.unsqueeze(2) - grid_coord.unsqueeze(1)
         return point[rel_pos_key]
 
+    @torch.no_grad()
+    def get_patch_index(self, point, cu_seqlens):
+        """
+        Index (P, K) of padded points in each patch and the mask of valid points,
+        patch shorter than patch size (sample with fewer points than patch size)
+        is filled with its first point and masked out. Return (None, None) if all
+        patches are complete.
+        """
+        patch_index_key = "patch_index"
+        patch_mask_key = "patch_mask"
+        if patch_index_key not in point.keys() or patch_mask_key not in point.keys():
+            start = cu_seqlens[:-1].long()
+            length = cu_seqlens.diff()
+            arange = torch.arange(self.patch_size, device=start.device)
+            mask = arange.unsqueeze(0) < length.unsqueeze(1)
+            if mask.all():
+                point[patch_index_key] = None
+                point[patch_mask_key] = None
+            else:
+                point[patch_index_key] = start.unsqueeze(1) + arange.unsqueeze(0) * mask
+                point[patch_mask_key] = mask
+        return point[patch_index_key], point[patch_mask_key]
+
     @torch.no_grad()
     def get_padding_and_inverse(self, point):
         pad_key = "pad"
@@ -183,7 +217,7 @@ class SerializedAttention(PointModule):
         return point[pad_key], point[unpad_key], point[cu_seqlens_key]
 
     def forward(self, point):
-        if not self.enable_flash:
+        if not self.enable_flash and not self.enable_sdpa:
             self.patch_size = min(
                 offset2bincount(point.offset).min().tolist(), self.patch_size_max
             )
@@ -200,7 +234,7 @@ class SerializedAttention(PointModule):
         # padding and reshape feat and batch for serialized point patch
         qkv = self.qkv(point.feat)[order]
 
-        if not self.enable_flash:
+        if not self.enable_flash and not self.enable_sdpa:
             # encode and reshape qkv: (N', K, 3, H, C') => (3, N', H, K, C')
             q, k, v = (
                 qkv.reshape(-1, K, 3, H, C // H).permute(2, 0, 3, 1, 4).unbind(dim=0)
@@ -217,6 +251,37 @@ class SerializedAttention(PointModule):
             attn = self.softmax(attn)
             attn = self.attn_drop(attn).to(qkv.dtype)
             feat = (attn @ v).transpose(1, 2).reshape(-1, C)
+        elif self.enable_sdpa:
+            patch_index, patch_mask = self.get_patch_index(point, cu_seqlens)
+            if patch_index is None:
+                qkv_patch = qkv.reshape(-1, K, 3, H, C // H)
+            else:
+                qkv_patch = qkv.reshape(-1, 3, H, C // H)[patch_index]
+            # (N', K, 3, H, C') => (3, N', H, K, C')
+            q, k, v = qkv_patch.permute(2, 0, 3, 1, 4).unbind(dim=0)
+            if self.upcast_attention:
+                q, k, v = q.float(), k.float(), v.float()
+            attn_mask = None
+            if patch_mask is not None:
+                attn_mask = patch_mask[:, None, None, :]  # (N', 1, 1, K)
+            if self.enable_rpe:
+                rpe = self.rpe(self.get_rel_pos(point, order, patch_index))
+                if attn_mask is not None:
+                    rpe = rpe.masked_fill(~attn_mask, float("-inf"))
+                attn_mask = rpe.to(q.dtype)
+            feat = nn.functional.scaled_dot_product_attention(
+                q,
+                k,
+                v,
+                attn_mask=attn_mask,
+                dropout_p=self.attn_drop if self.training else 0,
+                scale=self.scale,
+            )
+            # (N', H, K, C') => (N', K, C), drop masked points of incomplete patch
+            feat = feat.transpose(1, 2).reshape(-1, K, C)
+            if patch_mask is not None:
+                feat = feat[patch_mask]
+            feat = feat.reshape(-1, C).to(qkv.dtype)
         else:
             feat = flash_attn.flash_attn_varlen_qkvpacked_func(
                 qkv.half().reshape(-1, 3, H, C // H),
@@ -281,6 +346,7 @@ class Block(PointModule):
         cpe_indice_key=None,
         enable_rpe=False,
         enable_flash=True,
+        enable_sdpa=False,
         upcast_attention=True,
         upcast_softmax=True,
     ):
@@ -317,6 +383,7 @@ class Block(PointModule):
             order_index=order_index,
             enable_rpe=enable_rpe,
             enable_flash=enable_flash,
+            enable_sdpa=enable_sdpa,
             upcast_attention=upcast_attention,
             upcast_softmax=upcast_softmax,
         )
@@ -564,6 +631,7 @@ class PointTransformerV3(PointModule):
         shuffle_orders=True,
         enable_rpe=False,
         enable_flash=True,
+        enable_sdpa=False,
         upcast_attention=False,
         upcast_softmax=False,
         traceable=False,
@@ -642,6 +710,7 @@ class PointTransformerV3(PointModule):
                         cpe_indice_key=f"stage{s}",
                         enable_rpe=enable_rpe,
                         enable_flash=enable_flash,
+                        enable_sdpa=enable_sdpa,
                         upcast_attention=upcast_attention,
                         upcast_softmax=upcast_softmax,
                     ),
@@ -694,6 +763,7 @@ class PointTransformerV3(PointModule):
                             cpe_indice_key=f"stage{s}",
                             enable_rpe=enable_rpe,
                             enable_flash=enable_flash,
+                            enable_sdpa=enable_sdpa,
                             upcast_attention=upcast_attention,
                             upcast_softmax=upcast_softmax,
                         ),
@@ -6,4 +6,6 @@ from .misc import (
     off_diagonal,
 )
 from .checkpoint import checkpoint
-from .serialization import encode, decode
+from .serialization import encode, decode, argsort_code
+from .inference import optimize_for_inference, quantize_dynamic
+from .cache import NeighbourCache, cached
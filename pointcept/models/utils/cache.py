@@ -0,0 +1,39 @@
+"""
+Neighbourhood Cache
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+
+class NeighbourCache:
+    """
+    Replay cache of structures which depend on the points but not on the features
+    (kNN reference index, pooling clusters, serialization order), shared by the
+    test-time augmentation variants of one fragment.
+
+    The first forward pass records the structures in the order they are queried, the
+    following passes (call `rewind` before each) replay them. kNN neighbourhoods are
+    invariant under rotation, flip and uniform scaling; pooling clusters and
+    serialization orders of the first variant are carried along to the others instead
+    of being recomputed on the transformed coordinates.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.items = []
+        self.cursor = 0
+
+    def rewind(self):
+        self.cursor = 0
+
+    def get(self, fn):
+        if self.cursor == len(self.items):
+            self.items.append(fn())
+        item = self.items[self.cursor]
+        self.cursor += 1
+        return item
+
+
+def cached(cache, fn):
+    return fn() if cache is None else cache.get(fn)
@@ -0,0 +1,124 @@
+"""
+Inference Utils
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import torch
+import torch.nn as nn
+
+
+def is_batch_norm(module):
+    # nn.BatchNorm1d or wrappers holding one as `norm` (e.g. PointBatchNorm of PTv2)
+    if isinstance(module, nn.BatchNorm1d):
+        return True
+    return (
+        type(module).__name__ == "PointBatchNorm"
+        and isinstance(getattr(module, "norm", None), nn.BatchNorm1d)
+        and len(module._modules) == 1
+    )
+
+
+def fold_linear_bn(linear, bn):
+    """Fold an eval mode BatchNorm applied on the output channels into the Linear."""
+    bn = bn.norm if not isinstance(bn, nn.BatchNorm1d) else bn
+    assert bn.track_running_stats and bn.running_mean is not None
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.affine:
+        scale = scale * bn.weight
+    bias = linear.bias if linear.bias is not None else torch.zeros_like(bn.running_mean)
+    bias = (bias - bn.running_mean) * scale
+    if bn.affine:
+        bias = bias + bn.bias
+    with torch.no_grad():
+        linear.weight.mul_(scale.unsqueeze(-1).to(linear.weight.dtype))
+    linear.bias = nn.Parameter(bias.to(linear.weight.dtype).detach())
+    return linear
+
+
+def fold_batch_norm(model):
+    """Fold BatchNorm into the preceding Linear.
+
+    Two patterns are folded: adjacent (Linear, BatchNorm) in nn.Sequential, and
+    (linear, norm) attribute pairs declared by a module in its `fold_pairs`
+    (see Block of PTv2m2), meaning the norm is only ever applied on the output of
+    the linear. Folded norms are replaced by nn.Identity.
+    """
+    count = 0
+    for module in model.modules():
+        if isinstance(module, nn.Sequential):
+            names = list(module._modules.keys())
+            for name, next_name in zip(names[:-1], names[1:]):
+                linear, bn = module._modules[name], module._modules[next_name]
+                if isinstance(linear, nn.Linear) and is_batch_norm(bn):
+                    fold_linear_bn(linear, bn)
+                    module._modules[next_name] = nn.Identity()
+                    count += 1
+        for linear_name, bn_name in getattr(module, "fold_pairs", ()):
+            linear, bn = getattr(module, linear_name), getattr(module, bn_name)
+            if isinstance(linear, nn.Linear) and is_batch_norm(bn):
+                fold_linear_bn(linear, bn)
+                setattr(module, bn_name, nn.Identity())
+                count += 1
+    return count
+
+
+def strip_dropout(model):
+    """Replace dropout and drop path (identity in eval mode) by nn.Identity."""
+    count = 0
+    for module in model.modules():
+        for name, child in module._modules.items():
+            if isinstance(child, nn.modules.dropout._DropoutNd) or (
+                type(child).__name__ == "DropPath"
+            ):
+                module._modules[name] = nn.Identity()
+                count += 1
+    return count
+
+
+def optimize_for_inference(model):
+    """Rewrite a model in place for inference only usage.
+
+    BatchNorm is folded into the preceding Linear, dropout and drop path modules are
+    removed and the criteria of default segmentors / classifier is released so that
+    the model does not compute loss even if the target is given. The model is switched
+    to eval mode and can not be trained afterwards.
+    """
+    model.eval()
+    fold_batch_norm(model)
+    strip_dropout(model)
+    from pointcept.models.default import (
+        DefaultSegmentor,
+        DefaultSegmentorV2,
+        DINOEnhancedSegmentor,
+        DefaultClassifier,
+    )
+
+    for module in model.modules():
+        if isinstance(
+            module,
+            (
+                DefaultSegmentor,
+                DefaultSegmentorV2,
+                DINOEnhancedSegmentor,
+                DefaultClassifier,
+            ),
+        ):
+            module.criteria = None
+    for param in model.parameters():
+        param.requires_grad = False
+    return model
+
+
+def quantize_dynamic(model, dtype=torch.qint8):
+    """Post-training dynamic quantization of nn.Linear for cpu inference.
+
+    Weights are quantized ahead of time and activations on the fly, the rest of the
+    model (convolution, norm, etc.) keeps running in float on cpu. Apply
+    optimize_for_inference first so that folded BatchNorm are quantized as well.
+    """
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(
+        model.cpu(), {nn.Linear}, dtype=dtype, inplace=True
+    )
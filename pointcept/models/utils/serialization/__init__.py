@@ -1,6 +1,7 @@
 from .default import (
     encode,
     decode,
+    argsort_code,
     z_order_encode,
     z_order_decode,
     hilbert_encode,
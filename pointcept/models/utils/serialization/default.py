@@ -24,6 +24,21 @@ def encode(grid_coord, batch=None, depth=16, order="z"):
     return code
 
 
+@torch.inference_mode()
+def argsort_code(code, batch=None):
+    """
+    Argsort serialization codes (k, n) along the point dimension.
+    If the batch index is not packed into the code (deep serialization whose
+    code and batch bits exceed int64), pass `batch` to sort lexicographically
+    by (batch, code) with two stable sorts.
+    """
+    if batch is None:
+        return torch.argsort(code)
+    order = torch.argsort(code, stable=True)
+    batch_order = torch.argsort(batch[order], stable=True)
+    return torch.gather(order, 1, batch_order)
+
+
 @torch.inference_mode()
 def decode(code, depth=16, order="z"):
     assert order in {"z", "hilbert"}
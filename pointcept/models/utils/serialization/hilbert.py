@@ -2,6 +2,12 @@
 Hilbert Order
 Modified from https://github.com/PrincetonLIPS/numpy-hilbert-curve
 
+The bitwise transform of Skilling only modifies lower bits according to higher
+bits, so the curve is equivalent to a finite state machine walking from the most
+significant bit to the least significant bit. The states (axis permutation, axis
+inversion and gray code parity) are enumerated once and the transitions of several
+bits per step are stored in look up tables, which avoid unpacking to bit tensors.
+
 Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com), Kaixin Xu
 Please cite our work if the code is helpful to you.
 """
@@ -9,89 +15,140 @@ Please cite our work if the code is helpful to you.
 import torch
 
 
-def right_shift(binary, k=1, axis=-1):
-    """Right shift an array of binary values.
-
-    Parameters:
-    -----------
-     binary: An ndarray of binary values.
-
-     k: The number of bits to shift. Default 1.
-
-     axis: The axis along which to shift.  Default -1.
-
-    Returns:
-    --------
-     Returns an ndarray with zero prepended and the ends truncated, along
-     whatever axis was specified."""
-
-    # If we're shifting the whole thing, just return zeros.
-    if binary.shape[axis] <= k:
-        return torch.zeros_like(binary)
-
-    # Determine the padding pattern.
-    # padding = [(0,0)] * len(binary.shape)
-    # padding[axis] = (k,0)
-
-    # Determine the slicing pattern to eliminate just the last one.
-    slicing = [slice(None)] * len(binary.shape)
-    slicing[axis] = slice(None, -k)
-    shifted = torch.nn.functional.pad(
-        binary[tuple(slicing)], (k, 0), mode="constant", value=0
-    )
-
-    return shifted
-
-
-def binary2gray(binary, axis=-1):
-    """Convert an array of binary values into Gray codes.
-
-    This uses the classic X ^ (X >> 1) trick to compute the Gray code.
-
-    Parameters:
-    -----------
-     binary: An ndarray of binary values.
-
-     axis: The axis along which to compute the gray code. Default=-1.
-
-    Returns:
-    --------
-     Returns an ndarray of Gray codes.
-    """
-    shifted = right_shift(binary, axis=axis)
-
-    # Do the X ^ (X >> 1) trick.
-    gray = torch.logical_xor(binary, shifted)
-
-    return gray
-
-
-def gray2binary(gray, axis=-1):
-    """Convert an array of Gray codes back into binary values.
-
-    Parameters:
-    -----------
-     gray: An ndarray of gray codes.
-
-     axis: The axis along which to perform Gray decoding. Default=-1.
-
-    Returns:
-    --------
-     Returns an ndarray of binary values.
-    """
-
-    # Loop the log2(bits) number of times necessary, with shift and xor.
-    shift = 2 ** (torch.Tensor([gray.shape[axis]]).log2().ceil().int() - 1)
-    while shift > 0:
-        gray = torch.logical_xor(gray, right_shift(gray, shift))
-        shift = torch.div(shift, 2, rounding_mode="floor")
-    return gray
+class HilbertLUT:
+    def __init__(self, num_dims=3, bits_per_step=4):
+        self.num_dims = num_dims
+        self.bits_per_step = bits_per_step
+        self.states = self.enumerate_states()
+        cpu = torch.device("cpu")
+        self._encode = {cpu: {}}
+        self._decode = {cpu: {}}
+        for levels in range(1, bits_per_step + 1):
+            encode_lut, decode_lut = self.build_lut(levels)
+            self._encode[cpu][levels] = encode_lut
+            self._decode[cpu][levels] = decode_lut
+
+    def encode_lut(self, levels, device=torch.device("cpu")):
+        if device not in self._encode:
+            cpu = torch.device("cpu")
+            self._encode[device] = {
+                k: v.to(device) for k, v in self._encode[cpu].items()
+            }
+        return self._encode[device][levels]
+
+    def decode_lut(self, levels, device=torch.device("cpu")):
+        if device not in self._decode:
+            cpu = torch.device("cpu")
+            self._decode[device] = {
+                k: v.to(device) for k, v in self._decode[cpu].items()
+            }
+        return self._decode[device][levels]
+
+    def step(self, state, bits):
+        """One level of Skilling's transform.
+
+        state: (perm, flip, parity), bits of lower levels are read as
+            bits[perm[i]] ^ flip[i], parity is the last bit of the binary code.
+        bits: raw bits of each dimension at current level.
+        Return the output bits (binary code) of this level and the next state.
+        """
+        perm, flip, parity = list(state[0]), list(state[1]), state[2]
+        gray = [bits[perm[i]] ^ flip[i] for i in range(self.num_dims)]
+        for dim in range(self.num_dims):
+            if gray[dim]:
+                # invert the 0 dimension for lower bits
+                flip[0] ^= 1
+            else:
+                # exchange the lower bits with the 0 dimension
+                perm[0], perm[dim] = perm[dim], perm[0]
+                flip[0], flip[dim] = flip[dim], flip[0]
+        # gray code to binary code
+        out = 0
+        for g in gray:
+            parity ^= g
+            out = out << 1 | parity
+        return out, (tuple(perm), tuple(flip), parity)
+
+    def enumerate_states(self):
+        init = (tuple(range(self.num_dims)), (0,) * self.num_dims, 0)
+        states, queue = {init: 0}, [init]
+        while queue:
+            state = queue.pop()
+            for value in range(1 << self.num_dims):
+                bits = [
+                    value >> (self.num_dims - 1 - i) & 1 for i in range(self.num_dims)
+                ]
+                _, next_state = self.step(state, bits)
+                if next_state not in states:
+                    states[next_state] = len(states)
+                    queue.append(next_state)
+        return states
+
+    def build_lut(self, levels):
+        """Transition tables of `levels` bits per step.
+
+        The input index packs `levels` bits of each dimension as
+        [dim0 bits, dim1 bits, ...], the output packs the binary code of each level.
+        Entries store the output (or input for decode) in the low `num_dims * levels`
+        bits and the next state above, flattened by state * 2 ** (num_dims * levels).
+        """
+        # single level transitions, (num_states << num_dims)
+        single = torch.zeros(len(self.states) << self.num_dims, dtype=torch.int64)
+        for state, state_id in self.states.items():
+            for value in range(1 << self.num_dims):
+                bits = [
+                    value >> (self.num_dims - 1 - i) & 1 for i in range(self.num_dims)
+                ]
+                out, next_state = self.step(state, bits)
+                single[state_id << self.num_dims | value] = (
+                    out | self.states[next_state] << self.num_dims
+                )
+        # compose single level transitions for all (state, index) pairs
+        width = self.num_dims * levels
+        state = torch.arange(len(self.states)).repeat_interleave(1 << width)
+        index = torch.arange(1 << width).repeat(len(self.states))
+        key = state << width | index
+        code = torch.zeros_like(index)
+        for level in range(levels - 1, -1, -1):
+            value = torch.zeros_like(index)
+            for dim in range(self.num_dims):
+                shift = (self.num_dims - 1 - dim) * levels + level
+                value = value << 1 | (index >> shift) & 1
+            entry = single[state << self.num_dims | value]
+            code = code << self.num_dims | entry & ((1 << self.num_dims) - 1)
+            state = entry >> self.num_dims
+        encode_lut = code | state << width
+        decode_lut = torch.zeros_like(encode_lut)
+        decode_lut[key >> width << width | code] = index | state << width
+        return encode_lut, decode_lut
+
+    def schedule(self, num_bits):
+        # (levels, shift) of each step, from the most significant bit
+        steps = []
+        remain = num_bits % self.bits_per_step
+        shift = num_bits
+        if remain > 0:
+            shift -= remain
+            steps.append((remain, shift))
+        while shift > 0:
+            shift -= self.bits_per_step
+            steps.append((self.bits_per_step, shift))
+        return steps
+
+
+_hilbert_lut = {}
+
+
+def get_lut(num_dims):
+    if num_dims not in _hilbert_lut:
+        _hilbert_lut[num_dims] = HilbertLUT(num_dims=num_dims)
+    return _hilbert_lut[num_dims]
 
 
 def encode(locs, num_dims, num_bits):
     """Decode an array of locations in a hypercube into a Hilbert integer.
 
-    This is a vectorized-ish version of the Hilbert curve implementation by John
+    This is a look up table version of the Hilbert curve implementation by John
     Skilling as described in:
 
     Skilling, J. (2004, April). Programming the Hilbert curve. In AIP Conference
@@ -110,98 +167,45 @@ def encode(locs, num_dims, num_bits):
 
     Returns:
     --------
-     The output is an ndarray of uint64 integers with the same shape as the
+     The output is an ndarray of int64 integers with the same shape as the
      input, excluding the last dimension, which needs to be num_dims.
     """
 
     # Keep around the original shape for later.
     orig_shape = locs.shape
-    bitpack_mask = 1 << torch.arange(0, 8).to(locs.device)
-    bitpack_mask_rev = bitpack_mask.flip(-1)
 
     if orig_shape[-1] != num_dims:
-        raise ValueError(
-            """
+        raise ValueError("""
       The shape of locs was surprising in that the last dimension was of size
       %d, but num_dims=%d.  These need to be equal.
-      """
-            % (orig_shape[-1], num_dims)
-        )
+      """ % (orig_shape[-1], num_dims))
 
     if num_dims * num_bits > 63:
-        raise ValueError(
-            """
+        raise ValueError("""
       num_dims=%d and num_bits=%d for %d bits total, which can't be encoded
       into a int64.  Are you sure you need that many points on your Hilbert
       curve?
-      """
-            % (num_dims, num_bits, num_dims * num_bits)
-        )
-
-    # Treat the location integers as 64-bit unsigned and then split them up into
-    # a sequence of uint8s.  Preserve the association by dimension.
-    locs_uint8 = locs.long().view(torch.uint8).reshape((-1, num_dims, 8)).flip(-1)
-
-    # Now turn these into bits and truncate to num_bits.
-    gray = (
-        locs_uint8.unsqueeze(-1)
-        .bitwise_and(bitpack_mask_rev)
-        .ne(0)
-        .byte()
-        .flatten(-2, -1)[..., -num_bits:]
-    )
-
-    # Run the decoding process the other way.
-    # Iterate forwards through the bits.
-    for bit in range(0, num_bits):
-        # Iterate forwards through the dimensions.
-        for dim in range(0, num_dims):
-            # Identify which ones have this bit active.
-            mask = gray[:, dim, bit]
-
-            # Where this bit is on, invert the 0 dimension for lower bits.
-            gray[:, 0, bit + 1 :] = torch.logical_xor(
-                gray[:, 0, bit + 1 :], mask[:, None]
-            )
-
-            # Where the bit is off, exchange the lower bits with the 0 dimension.
-            to_flip = torch.logical_and(
-                torch.logical_not(mask[:, None]).repeat(1, gray.shape[2] - bit - 1),
-                torch.logical_xor(gray[:, 0, bit + 1 :], gray[:, dim, bit + 1 :]),
-            )
-            gray[:, dim, bit + 1 :] = torch.logical_xor(
-                gray[:, dim, bit + 1 :], to_flip
-            )
-            gray[:, 0, bit + 1 :] = torch.logical_xor(gray[:, 0, bit + 1 :], to_flip)
-
-    # Now flatten out.
-    gray = gray.swapaxes(1, 2).reshape((-1, num_bits * num_dims))
-
-    # Convert Gray back to binary.
-    hh_bin = gray2binary(gray)
-
-    # Pad back out to 64 bits.
-    extra_dims = 64 - num_bits * num_dims
-    padded = torch.nn.functional.pad(hh_bin, (extra_dims, 0), "constant", 0)
-
-    # Convert binary values into uint8s.
-    hh_uint8 = (
-        (padded.flip(-1).reshape((-1, 8, 8)) * bitpack_mask)
-        .sum(2)
-        .squeeze()
-        .type(torch.uint8)
-    )
-
-    # Convert uint8s into uint64s.
-    hh_uint64 = hh_uint8.view(torch.int64).squeeze()
-
-    return hh_uint64
+      """ % (num_dims, num_bits, num_dims * num_bits))
+
+    lut = get_lut(num_dims)
+    locs = locs.long().reshape(-1, num_dims)
+    state = torch.zeros_like(locs[:, 0])
+    hilberts = torch.zeros_like(locs[:, 0])
+    for levels, shift in lut.schedule(num_bits):
+        width = num_dims * levels
+        index = torch.zeros_like(hilberts)
+        for dim in range(num_dims):
+            index = index << levels | (locs[:, dim] >> shift) & ((1 << levels) - 1)
+        entry = lut.encode_lut(levels, locs.device)[(state << width) | index]
+        hilberts = hilberts << width | entry & ((1 << width) - 1)
+        state = entry >> width
+    return hilberts.reshape(orig_shape[:-1])
 
 
 def decode(hilberts, num_dims, num_bits):
     """Decode an array of Hilbert integers into locations in a hypercube.
 
-    This is a vectorized-ish version of the Hilbert curve implementation by John
+    This is a look up table version of the Hilbert curve implementation by John
     Skilling as described in:
 
     Skilling, J. (2004, April). Programming the Hilbert curve. In AIP Conference
@@ -218,86 +222,33 @@ def decode(hilberts, num_dims, num_bits):
 
     Returns:
     --------
-     The output is an ndarray of unsigned integers with the same shape as hilberts
+     The output is an ndarray of int64 integers with the same shape as hilberts
      but with an additional dimension of size num_dims.
     """
 
-    if num_dims * num_bits > 64:
-        raise ValueError(
-            """
+    if num_dims * num_bits > 63:
+        raise ValueError("""
       num_dims=%d and num_bits=%d for %d bits total, which can't be encoded
-      into a uint64.  Are you sure you need that many points on your Hilbert
+      into a int64.  Are you sure you need that many points on your Hilbert
       curve?
-      """
-            % (num_dims, num_bits)
-        )
+      """ % (num_dims, num_bits, num_dims * num_bits))
 
     # Handle the case where we got handed a naked integer.
     hilberts = torch.atleast_1d(hilberts)
 
     # Keep around the shape for later.
     orig_shape = hilberts.shape
-    bitpack_mask = 2 ** torch.arange(0, 8).to(hilberts.device)
-    bitpack_mask_rev = bitpack_mask.flip(-1)
-
-    # Treat each of the hilberts as a s equence of eight uint8.
-    # This treats all of the inputs as uint64 and makes things uniform.
-    hh_uint8 = (
-        hilberts.ravel().type(torch.int64).view(torch.uint8).reshape((-1, 8)).flip(-1)
-    )
-
-    # Turn these lists of uints into lists of bits and then truncate to the size
-    # we actually need for using Skilling's procedure.
-    hh_bits = (
-        hh_uint8.unsqueeze(-1)
-        .bitwise_and(bitpack_mask_rev)
-        .ne(0)
-        .byte()
-        .flatten(-2, -1)[:, -num_dims * num_bits :]
-    )
-
-    # Take the sequence of bits and Gray-code it.
-    gray = binary2gray(hh_bits)
-
-    # There has got to be a better way to do this.
-    # I could index them differently, but the eventual packbits likes it this way.
-    gray = gray.reshape((-1, num_bits, num_dims)).swapaxes(1, 2)
-
-    # Iterate backwards through the bits.
-    for bit in range(num_bits - 1, -1, -1):
-        # Iterate backwards through the dimensions.
-        for dim in range(num_dims - 1, -1, -1):
-            # Identify which ones have this bit active.
-            mask = gray[:, dim, bit]
-
-            # Where this bit is on, invert the 0 dimension for lower bits.
-            gray[:, 0, bit + 1 :] = torch.logical_xor(
-                gray[:, 0, bit + 1 :], mask[:, None]
-            )
-
-            # Where the bit is off, exchange the lower bits with the 0 dimension.
-            to_flip = torch.logical_and(
-                torch.logical_not(mask[:, None]),
-                torch.logical_xor(gray[:, 0, bit + 1 :], gray[:, dim, bit + 1 :]),
-            )
-            gray[:, dim, bit + 1 :] = torch.logical_xor(
-                gray[:, dim, bit + 1 :], to_flip
-            )
-            gray[:, 0, bit + 1 :] = torch.logical_xor(gray[:, 0, bit + 1 :], to_flip)
-
-    # Pad back out to 64 bits.
-    extra_dims = 64 - num_bits
-    padded = torch.nn.functional.pad(gray, (extra_dims, 0), "constant", 0)
-
-    # Now chop these up into blocks of 8.
-    locs_chopped = padded.flip(-1).reshape((-1, num_dims, 8, 8))
-
-    # Take those blocks and turn them unto uint8s.
-    # from IPython import embed; embed()
-    locs_uint8 = (locs_chopped * bitpack_mask).sum(3).squeeze().type(torch.uint8)
-
-    # Finally, treat these as uint64s.
-    flat_locs = locs_uint8.view(torch.int64)
-
-    # Return them in the expected shape.
-    return flat_locs.reshape((*orig_shape, num_dims))
+
+    lut = get_lut(num_dims)
+    hilberts = hilberts.long().reshape(-1)
+    state = torch.zeros_like(hilberts)
+    locs = [torch.zeros_like(hilberts) for _ in range(num_dims)]
+    for levels, shift in lut.schedule(num_bits):
+        width = num_dims * levels
+        code = (hilberts >> shift * num_dims) & ((1 << width) - 1)
+        entry = lut.decode_lut(levels, hilberts.device)[(state << width) | code]
+        for dim in range(num_dims):
+            chunk = entry >> (num_dims - 1 - dim) * levels & ((1 << levels) - 1)
+            locs[dim] = locs[dim] << levels | chunk
+        state = entry >> width
+    return torch.stack(locs, dim=-1).reshape((*orig_shape, num_dims))
@@ -81,20 +81,22 @@ def xyz2key(
       b (torch.Tensor or int): The batch index of the coordinates, and should be
           smaller than 32768. If :attr:`b` is :obj:`torch.Tensor`, the size of
           :attr:`b` must be the same as :attr:`x`, :attr:`y`, and :attr:`z`.
-      depth (int): The depth of the shuffled key, and must be smaller than 17 (< 17).
+      depth (int): The depth of the shuffled key, and must be smaller than 22 (< 22).
+          The batch index can only be packed into the key if depth is smaller than 17.
     """
 
     EX, EY, EZ = _key_lut.encode_lut(x.device)
     x, y, z = x.long(), y.long(), z.long()
 
-    mask = 255 if depth > 8 else (1 << depth) - 1
-    key = EX[x & mask] | EY[y & mask] | EZ[z & mask]
-    if depth > 8:
-        mask = (1 << (depth - 8)) - 1
-        key16 = EX[(x >> 8) & mask] | EY[(y >> 8) & mask] | EZ[(z >> 8) & mask]
-        key = key16 << 24 | key
+    key = torch.zeros_like(x)
+    # encode 8 bits of each coordinate (24 bits of key) per look up
+    for i in range((depth + 7) // 8):
+        mask = (1 << min(depth - i * 8, 8)) - 1
+        x_, y_, z_ = (x >> i * 8) & mask, (y >> i * 8) & mask, (z >> i * 8) & mask
+        key = key | (EX[x_] | EY[y_] | EZ[z_]) << i * 24
 
     if b is not None:
+        assert depth <= 16
         b = b.long()
         key = b << 48 | key
 
@@ -107,14 +109,15 @@ def key2xyz(key: torch.Tensor, depth: int = 16):
 
     Args:
       key (torch.Tensor): The shuffled key.
-      depth (int): The depth of the shuffled key, and must be smaller than 17 (< 17).
+      depth (int): The depth of the shuffled key, and must be smaller than 22 (< 22).
     """
 
     DX, DY, DZ = _key_lut.decode_lut(key.device)
     x, y, z = torch.zeros_like(key), torch.zeros_like(key), torch.zeros_like(key)
 
-    b = key >> 48
-    key = key & ((1 << 48) - 1)
+    key_bits = max(depth, 16) * 3
+    b = key >> key_bits
+    key = key & ((1 << key_bits) - 1)
 
     n = (depth + 2) // 3
     for i in range(n):
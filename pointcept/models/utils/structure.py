@@ -8,7 +8,7 @@ except ImportError:
 from addict import Dict
 from typing import List
 
-from pointcept.models.utils.serialization import encode
+from pointcept.models.utils.serialization import encode, argsort_code
 from pointcept.models.utils import (
     offset2batch,
     batch2offset,
@@ -37,11 +37,20 @@ class Point(Dict):
     - "serialized_code": a list of serialization codes;
     - "serialized_order": a list of serialization order determined by code;
     - "serialized_inverse": a list of inverse mapping determined by code;
+    - "serialized_packed": whether batch index is packed into the high bits of code;
     (related to Sparsify: SpConv)
     - "sparse_shape": Sparse shape for Sparse Conv Tensor;
     - "sparse_conv_feat": SparseConvTensor init with information provide by Point;
     """
 
+    serialized_keys = (
+        "serialized_depth",
+        "serialized_packed",
+        "serialized_code",
+        "serialized_order",
+        "serialized_inverse",
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # If one of "offset" or "batch" do not exist, generate by the existing one
@@ -58,6 +67,17 @@ class Point(Dict):
         """
         self["order"] = order
         assert "batch" in self.keys()
+        if "neighbour_cache" in self.keys():
+            # serialization shared by test-time augmentation variants, see NeighbourCache
+            cache = self.pop("neighbour_cache")
+
+            def serialize():
+                self.serialization(order, depth, shuffle_orders)
+                return {key: self[key] for key in self.serialized_keys}
+
+            self.update(cache.get(serialize))
+            self["neighbour_cache"] = cache
+            return
         if "grid_coord" not in self.keys():
             # if you don't want to operate GridSampling in data augmentation,
             # please add the following augmentation into your pipline:
@@ -73,13 +93,14 @@ class Point(Dict):
             # Adaptive measure the depth of serialization cube (length = 2 ^ depth)
             depth = int(self.grid_coord.max() + 1).bit_length()
         self["serialized_depth"] = depth
-        # Maximum bit length for serialization code is 63 (int64)
-        assert depth * 3 + len(self.offset).bit_length() <= 63
-        # Here we follow OCNN and set the depth limitation to 16 (48bit) for the point position.
-        # Although depth is limited to less than 16, we can encode a 655.36^3 (2^16 * 0.01) meter^3
-        # cube with a grid size of 0.01 meter. We consider it is enough for the current stage.
-        # We can unlock the limitation by optimizing the z-order encoding function if necessary.
-        assert depth <= 16
+        # Maximum bit length for serialization code is 63 (int64), which limits the depth to
+        # 21 and encodes a 20971.52^3 (2^21 * 0.01) meter^3 cube with a grid size of 0.01 meter.
+        assert depth <= 21
+        # The batch index is packed into the high bits of the code if they fit into int64,
+        # otherwise the code only describes the position and the batch index is kept aside,
+        # points are then sorted lexicographically by (batch, code).
+        packed = depth * 3 + len(self.offset).bit_length() <= 63
+        self["serialized_packed"] = packed
 
         # The serialization codes are arranged as following structures:
         # [Order1 ([n]),
@@ -87,10 +108,11 @@ class Point(Dict):
         #   ...
         #  OrderN ([n])] (k, n)
         code = [
-            encode(self.grid_coord, self.batch, depth, order=order_) for order_ in order
+            encode(self.grid_coord, self.batch if packed else None, depth, order=order_)
+            for order_ in order
         ]
         code = torch.stack(code)
-        order = torch.argsort(code)
+        order = argsort_code(code, None if packed else self.batch)
         inverse = torch.zeros_like(order).scatter_(
             dim=1,
             index=order,
@@ -0,0 +1,55 @@
+"""
+Checkpoint Utils
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import pickle
+import torch
+from collections import OrderedDict
+
+
+def load_checkpoint(filename, map_location="cpu", mmap=True):
+    """Load a checkpoint saved by CheckpointSaver.
+
+    With `mmap=True` tensor storages are mapped from the file instead of being read,
+    so only the storages actually consumed (usually the `state_dict` section when
+    testing or fine-tuning) are paged in. Safe unpickling (`weights_only=True`) is
+    tried first, checkpoints carrying arbitrary python objects (e.g. old scheduler
+    states) fall back to the full unpickler, and legacy (non zip) checkpoints which
+    can not be memory-mapped are read eagerly.
+    """
+    try:
+        return torch.load(
+            filename, map_location=map_location, mmap=mmap, weights_only=True
+        )
+    except pickle.UnpicklingError:
+        return torch.load(
+            filename, map_location=map_location, mmap=mmap, weights_only=False
+        )
+    except RuntimeError:
+        if not mmap:
+            raise
+        return load_checkpoint(filename, map_location=map_location, mmap=False)
+
+
+def remap_state_dict(state_dict, ddp=False, keywords="", replacement=None):
+    """Adapt state dict keys to the (DDP wrapped or not) model.
+
+    Keys are normalized to "module.xxx", optionally the first `keywords` is replaced
+    by `replacement`, and "module." is stripped again for non DDP models. The returned
+    dict references the original tensors, no tensor is copied.
+    """
+    replacement = replacement if replacement is not None else keywords
+    weight = OrderedDict()
+    for key, value in state_dict.items():
+        if not key.startswith("module."):
+            key = "module." + key  # xxx.xxx -> module.xxx.xxx
+        # Now all keys contain "module." no matter DDP or not.
+        if keywords and keywords in key:
+            key = key.replace(keywords, replacement, 1)
+        if not ddp:
+            key = key[7:]  # module.xxx.xxx -> xxx.xxx
+        weight[key] = value
+    return weight
@@ -19,6 +19,22 @@ A torch process group which only includes processes that on the same machine as
 This variable is set when processes are spawned by `launch()` in "engine/launch.py".
 """
 
+_DEVICE_TYPE = "cuda"
+"""
+Device type ("cuda" or "cpu") the processes run on.
+This variable is set by `launch()` in "engine/launch.py".
+"""
+
+
+def get_device() -> torch.device:
+    """
+    Returns:
+        The device of the current process, current cuda device or cpu.
+    """
+    if _DEVICE_TYPE == "cpu":
+        return torch.device("cpu")
+    return torch.device("cuda", torch.cuda.current_device())
+
 
 def get_world_size() -> int:
     if not dist.is_available():
@@ -0,0 +1,97 @@
+"""
+Memory Utils
+
+Profile the peak memory of a model forward pass as a function of the number of
+points and fit a polynomial model, used to size fragments / crops to a memory budget.
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import numpy as np
+import torch
+
+
+class MemoryModel:
+    """Peak memory (bytes) of a forward pass, polynomial in the number of points."""
+
+    def __init__(self, coef):
+        self.coef = np.asarray(coef, dtype=np.float64)
+
+    @classmethod
+    def fit(cls, num_points, peak_memory, deg=1):
+        coef = np.polyfit(num_points, peak_memory, deg)
+        if coef[0] <= 0:
+            # peak memory not growing with the number of points (noise dominated
+            # profile), clamp to the largest observed bytes per point through zero
+            coef = np.zeros(deg + 1)
+            coef[-2] = max(p / n for n, p in zip(num_points, peak_memory) if n > 0)
+        return cls(coef)
+
+    def __call__(self, num_points):
+        return float(np.polyval(self.coef, num_points))
+
+    def max_points(self, budget, upper=1 << 31):
+        # largest number of points whose estimated peak memory fits into the budget
+        # (the model is assumed monotonic in the number of points)
+        lower = 0
+        while lower < upper:
+            mid = (lower + upper + 1) // 2
+            if self(mid) <= budget:
+                lower = mid
+            else:
+                upper = mid - 1
+        return lower
+
+    def __repr__(self):
+        return f"MemoryModel(coef={self.coef.tolist()})"
+
+
+def subsample_points(input_dict, num_points, seed=0):
+    """Randomly keep num_points points of a (single sample) collated input dict."""
+    total = input_dict["coord"].shape[0]
+    generator = torch.Generator().manual_seed(seed)
+    index = torch.randperm(total, generator=generator)[: min(num_points, total)]
+    index = index.sort()[0]
+    output_dict = dict()
+    for key, value in input_dict.items():
+        if isinstance(value, torch.Tensor) and value.dim() > 0 and len(value) == total:
+            output_dict[key] = value[index.to(value.device)]
+        else:
+            output_dict[key] = value
+    output_dict["offset"] = torch.tensor(
+        [len(index)], device=input_dict["offset"].device
+    )
+    return output_dict
+
+
+def profile_peak_memory(model, input_dict, num_points, device=None):
+    """Measure the peak memory (bytes) above the resting allocation of an inference
+    forward pass on subsets of input_dict (a collated fragment already on device) with
+    the given numbers of points. Returns the list of numbers of points actually
+    profiled and the list of peak memory."""
+    device = device if device is not None else input_dict["coord"].device
+    device = torch.device(device)
+    assert device.type == "cuda", "Peak memory profiling requires a cuda device."
+    total = input_dict["coord"].shape[0]
+    num_points = sorted(set(min(n, total) for n in num_points))
+    peak_memory = []
+    for n in num_points:
+        sample = subsample_points(input_dict, n)
+        torch.cuda.synchronize(device)
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats(device)
+        resting = torch.cuda.memory_allocated(device)
+        with torch.no_grad():
+            model(sample)
+        torch.cuda.synchronize(device)
+        peak_memory.append(torch.cuda.max_memory_allocated(device) - resting)
+        del sample
+    torch.cuda.empty_cache()
+    return num_points, peak_memory
+
+
+def fit_memory_model(model, input_dict, num_points, device=None, deg=1):
+    num_points, peak_memory = profile_peak_memory(model, input_dict, num_points, device)
+    assert len(num_points) > deg, "Not enough distinct point counts to fit the model."
+    return MemoryModel.fit(num_points, peak_memory, deg=deg)
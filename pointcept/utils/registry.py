@@ -1,6 +1,7 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import inspect
 import warnings
+from importlib import import_module
 from functools import partial
 
 from .misc import is_seq_of
@@ -89,6 +90,7 @@ class Registry:
     def __init__(self, name, build_func=None, parent=None, scope=None):
         self._name = name
         self._module_dict = dict()
+        self._lazy_module_dict = dict()
         self._children = dict()
         self._scope = self.infer_scope() if scope is None else scope
 
@@ -111,7 +113,7 @@ class Registry:
             self.parent = None
 
     def __len__(self):
-        return len(self._module_dict)
+        return len(self._module_dict) + len(self._lazy_module_dict)
 
     def __contains__(self, key):
         return self.get(key) is not None
@@ -196,6 +198,10 @@ class Registry:
         """
         scope, real_key = self.split_scope_key(key)
         if scope is None or scope == self._scope:
+            # import lazy registered module, which registers the class on import
+            if real_key not in self._module_dict and real_key in self._lazy_module_dict:
+                import_module(self._lazy_module_dict[real_key])
+                self._lazy_module_dict.pop(real_key, None)
             # get from self
             if real_key in self._module_dict:
                 return self._module_dict[real_key]
@@ -247,6 +253,29 @@ class Registry:
             if not force and name in self._module_dict:
                 raise KeyError(f"{name} is already registered " f"in {self.name}")
             self._module_dict[name] = module_class
+            self._lazy_module_dict.pop(name, None)
+
+    def register_lazy_module(self, module_path, names):
+        """Register names provided by a module without importing it.
+
+        The module is imported when one of the names is requested with
+        :meth:`get` (or :meth:`build`), and registers its classes as usual.
+
+        Example:
+            >>> backbones = Registry('backbone')
+            >>> backbones.register_lazy_module('mmdet.resnet', ['ResNet'])
+            >>> resnet = backbones.build(dict(type='ResNet'))
+
+        Args:
+            module_path (str): Absolute import path of the module.
+            names (str | Sequence[str]): Names registered in the module.
+        """
+        if isinstance(names, str):
+            names = [names]
+        for name in names:
+            if name in self._module_dict or name in self._lazy_module_dict:
+                raise KeyError(f"{name} is already registered " f"in {self.name}")
+            self._lazy_module_dict[name] = module_path
 
     def deprecated_register_module(self, cls=None, force=False):
         warnings.warn(
@@ -0,0 +1,56 @@
+"""
+Main Serving Script
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+from pointcept.engines.defaults import (
+    default_argument_parser,
+    default_config_parser,
+    default_setup,
+)
+from pointcept.engines.serve import SemSegServer
+from pointcept.engines.launch import launch
+
+
+def main_worker(cfg, args):
+    cfg = default_setup(cfg)
+    test_cfg = dict(cfg.test)
+    test_cfg.pop("type")
+    server = SemSegServer(
+        cfg=cfg,
+        host=args.host,
+        port=args.port,
+        max_points=args.max_points,
+        **test_cfg,
+    )
+    server.serve()
+
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=400000,
+        help="point budget of each batched forward pass",
+    )
+    args = parser.parse_args()
+    cfg = default_config_parser(args.config_file, args.options)
+
+    # a single serving process, launch applies the device / cpu thread setup
+    launch(
+        main_worker,
+        num_gpus_per_machine=1,
+        cfg=(cfg, args),
+        device=args.device,
+        num_threads=args.num_threads,
+        pin_cores=args.pin_cores,
+    )
+
+
+if __name__ == "__main__":
+    main()
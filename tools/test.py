@@ -32,6 +32,9 @@ def main():
         machine_rank=args.machine_rank,
         dist_url=args.dist_url,
         cfg=(cfg,),
+        device=args.device,
+        num_threads=args.num_threads,
+        pin_cores=args.pin_cores,
     )
 
 